@@ -0,0 +1,507 @@
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from loguru import logger
+import numpy as np
+import polars as pl
+import typer
+
+from hgm.config import DATA_DIR, PROJ_ROOT
+from hgm.data.ingest import read_league
+from hgm.data.league import load_players, load_teams, process_league
+from hgm.data.store import freeze
+from hgm.data import contracts, progression, simulation
+from hgm.models import cap_coefficients
+from hgm.data.process_data import process_players
+
+app = typer.Typer()
+
+POSITIONS = ['C', 'W', 'W', 'D', 'D', 'G']
+
+
+@app.callback()
+def main():
+    """Performance benchmarks run against synthetic league exports."""
+
+
+# %%
+def make_league(n_teams=32, players_per_team=40, history_seasons=10, n_games=0, season=2030, seed=0):
+    """
+    Build a synthetic league export with the same shape as a ZenGM hockey export.
+
+    :param n_teams: Number of active teams
+    :param players_per_team: Rostered players per team (plus free agents and draft prospects)
+    :param history_seasons: Seasons of ratings/stats history per player
+    :param n_games: Number of box scores (and 5x as many events) to pad the file with
+    :return: League as a dict, ready for json.dumps
+    """
+    rng = random.Random(seed)
+    tids = [tid for tid in range(n_teams) for _ in range(players_per_team)] + [-1, -2] * (3 * n_teams)
+
+    players = []
+    for pid, tid in enumerate(tids):
+        born = season - rng.randint(18, 38)
+        pos = rng.choice(POSITIONS)
+        first_season = season if tid == -2 else max(season - rng.randint(0, history_seasons), born + 18)
+        ovr = rng.randint(20, 55)
+
+        ratings = []
+        for rating_season in range(first_season, season + 1):
+            ovr = max(0, min(100, ovr + rng.randint(-3, 6)))
+            ratings.append({
+                'season': rating_season, 'pos': pos, 'ovr': ovr, 'pot': ovr + 5, 'fuzz': rng.random(),
+                'skills': ['Pm'], 'ovrs': {position: ovr for position in 'CWDG'},
+                **{rating: rng.randint(0, 100) for rating in
+                   ['hgt', 'stre', 'spd', 'endu', 'pss', 'wst', 'sst', 'stk', 'oiq', 'chk', 'blk', 'fcf', 'diq', 'glk']},
+            })
+
+        salaries = []
+        if tid >= 0:
+            amount = rng.randint(500, 12000)
+            for salary_season in range(first_season, season + rng.randint(1, 5)):
+                if rng.random() < 0.3:
+                    amount = rng.randint(500, 12000)
+                salaries.append({'season': salary_season, 'amount': amount})
+
+        players.append({
+            'pid': pid, 'tid': tid, 'firstName': f'First{pid}', 'lastName': f'Last{pid}',
+            'born': {'year': born, 'loc': rng.choice(['Toronto, ON, Canada', 'Stockholm, Sweden', 'Boston, MA, USA'])},
+            'draft': {'year': first_season - 1, 'round': 1, 'pick': rng.randint(1, n_teams), 'tid': 0, 'originalTid': 0},
+            'ratings': ratings,
+            'salaries': salaries,
+            'stats': [
+                {'season': stat_season, 'tid': tid, 'playoffs': playoffs, 'gp': rng.randint(0, 82),
+                 'g': rng.randint(0, 50), 'a': rng.randint(0, 50), 'pm': rng.randint(-20, 20), 'min': rng.random() * 1500}
+                for stat_season in range(first_season, season + 1) for playoffs in [False, True]
+            ],
+            'contract': {'amount': salaries[-1]['amount'] if salaries else 500, 'exp': season + 1},
+            'injury': {'type': 'Healthy', 'gamesRemaining': 0},
+            'awards': [],
+            'value': 50.0,
+        })
+
+    return {
+        'version': 60,
+        'meta': {'name': 'Synthetic', 'phaseText': f'{season} regular season'},
+        'gameAttributes': {
+            'season': season, 'maxContract': 13000, 'minContract': 500, 'salaryCap': 80000,
+            'userTid': [{'start': None, 'value': 0}],
+        },
+        'players': players,
+        'teams': [
+            {'tid': tid, 'abbrev': f'T{tid:02d}', 'region': f'Region {tid}', 'name': f'Team {tid}', 'disabled': False,
+             'seasons': [{'season': team_season, 'won': rng.randint(0, 82)}
+                         for team_season in range(season - history_seasons, season + 1)]}
+            for tid in range(n_teams)
+        ],
+        'games': [
+            {'gid': gid, 'season': season, 'teams': [
+                {'tid': home_away, 'pts': rng.randint(0, 6), 'players': [
+                    {'pid': pid, 'g': rng.randint(0, 2), 'a': rng.randint(0, 2), 'min': rng.random() * 25}
+                    for pid in range(20)
+                ]} for home_away in range(2)
+            ]}
+            for gid in range(n_games)
+        ],
+        'events': [
+            {'eid': eid, 'type': 'trade', 'season': season, 'text': f'The <a href="/l/1/roster/T{eid % n_teams:02d}">team</a> traded'}
+            for eid in range(5 * n_games)
+        ],
+    }
+
+
+def write_league(path, **kwargs):
+    path = Path(path)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(make_league(**kwargs)))
+    return path
+
+
+def _peak_memory_mb():
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start, _peak_memory_mb()
+
+
+def measure(fn, *args, **kwargs):
+    """Run fn in a fresh process and return (seconds, peak RSS in MB) of that process."""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(_timed, fn, *args, **kwargs).result()
+
+
+# %%
+def _ingest_read_json(path):
+    pl_json = pl.read_json(io.BytesIO(Path(path).read_bytes()))
+    pl_json.select('gameAttributes').item()
+    pl_json.select('teams').explode('teams').unnest('teams')
+    pl_json.select('players').explode('players').unnest('players')
+
+
+def _ingest_streaming(path):
+    read_league(io.BytesIO(Path(path).read_bytes()))
+
+
+@app.command()
+def ingest(n_games: int = 50_000, history_seasons: int = 15, repeats: int = 3):
+    """Compare pl.read_json on the whole export with the streaming ingestion layer."""
+    path = write_league(
+        DATA_DIR / 'interim' / f'bench_league_{n_games}_{history_seasons}.json',
+        n_games=n_games, history_seasons=history_seasons,
+    )
+    logger.info(f'League file: {path.stat().st_size / 1e6:.0f} MB')
+    for name, fn in [('pl.read_json', _ingest_read_json), ('read_league', _ingest_streaming)]:
+        runs = [measure(fn, path) for _ in range(repeats)]
+        logger.info(f'{name:>14}: {min(run[0] for run in runs):.2f}s, peak RSS {max(run[1] for run in runs):.0f} MB')
+
+
+# %%
+def _seconds_in_fresh_interpreter(statement):
+    script = f'import time\nstart = time.perf_counter()\n{statement}\nprint(time.perf_counter() - start)'
+    result = subprocess.run([sys.executable, '-c', script], cwd=PROJ_ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+STARTUP_CASES = {
+    'import hgm.data.process_data': 'import hgm.data.process_data',
+    'unpickle all models (old import cost)': (
+        'from hgm.models import POSITIONS, CAP_MODELS_DIR, SALARY_MODEL_PATH, _unpickle\n'
+        '[_unpickle(CAP_MODELS_DIR / f"{position}.pkl") for position in POSITIONS]\n'
+        '_unpickle(SALARY_MODEL_PATH)'
+    ),
+    'hgm_app.py first render': (
+        'from streamlit.testing.v1 import AppTest\n'
+        'AppTest.from_file("hgm_app.py", default_timeout=60).run()'
+    ),
+}
+
+
+@app.command()
+def startup(repeats: int = 5):
+    """Cold-start cost of importing the pipeline and of the first render of hgm_app.py."""
+    for name, statement in STARTUP_CASES.items():
+        seconds = min(_seconds_in_fresh_interpreter(statement) for _ in range(repeats))
+        logger.info(f'{name:>40}: {seconds:.3f}s')
+
+
+# %%
+def _best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@app.command()
+def horizons(sizes: list[int] = [5_000, 50_000, 500_000], horizon: int = 5, repeats: int = 3):
+    """Season-range expansion: per-row Python lambdas versus native int_ranges."""
+    for n in sizes:
+        df = pl.LazyFrame({'pid': range(n), 'season': [2030 + pid % 10 for pid in range(n)]})
+        cases = {
+            'map_elements': lambda: df.with_columns(
+                season=pl.col('season').map_elements(lambda x: list(range(x, x + horizon)), return_dtype=pl.List(pl.Int64))
+            ).explode('season').collect(),
+            'int_ranges': lambda: df.with_columns(
+                season=pl.int_ranges(pl.col('season'), pl.col('season') + horizon)
+            ).explode('season').collect(),
+            'Series of range': lambda: df.with_columns(
+                pl.Series('season', [range(2030, 2030 + horizon)], dtype=pl.List)
+            ).explode('season').collect(),
+            'int_ranges (fixed)': lambda: df.with_columns(
+                season=pl.int_ranges(2030, 2030 + horizon)
+            ).explode('season').collect(),
+        }
+        for name, fn in cases.items():
+            logger.info(f'{n:>8} players, {name:>18}: {_best_of(fn, repeats) * 1000:.1f} ms')
+
+
+# %%
+def _pipeline(path, repeats):
+    league = read_league(path)
+    teams = load_teams(league['teams'])
+    seconds = _best_of(lambda: load_players(league['players'], teams, league['game_settings']), repeats)
+    return seconds, _peak_memory_mb()
+
+
+@app.command()
+def pipeline(teams: list[int] = [30, 64, 128], repeats: int = 3):
+    """Wall time and peak RSS of the player pipeline, from raw players to the display-ready frame."""
+    for n_teams in teams:
+        path = write_league(DATA_DIR / 'interim' / f'bench_league_{n_teams}_teams.json', n_teams=n_teams)
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            seconds, peak_mb = executor.submit(_pipeline, path, repeats).result()
+        logger.info(f'{n_teams:>4} teams: {seconds * 1000:.0f} ms, peak RSS {peak_mb:.0f} MB')
+
+
+# %%
+PID_AGGREGATES = {
+    'pot': pl.col('ovr').max(),
+    'contract_value': pl.col('surplus').sum(),
+    'years': (pl.col('status') == 'current').sum(),
+    'max_value': pl.col('value').max(),
+    'sum_value': pl.col('value').sum(),
+}
+RANKS = {'p_rk': ['season', 'pos'], 'pr_rk': ['season', 'draft_year'], 'pr_rk_pos': ['season', 'pos', 'draft_year']}
+
+
+def _separate_windows(df):
+    for name, expr in PID_AGGREGATES.items():
+        df = df.with_columns(expr.over('pid').alias(name))
+    for name, by in RANKS.items():
+        df = df.with_columns(pl.col('ovr').rank('ordinal', descending=True).over(by).alias(name))
+    return df
+
+
+def _group_by_and_sort_ranks(df):
+    df = df.join(df.group_by('pid').agg(**PID_AGGREGATES), on='pid', how='left')
+    for name, by in RANKS.items():
+        # One global sort on the partition key, then subtract the start of each run
+        new_run = pl.any_horizontal(pl.col(by).ne_missing(pl.col(by).shift()))
+        df = (
+            df
+            .with_row_index('row')
+            .sort([*by, 'ovr', 'pid', 'season'], descending=[False] * len(by) + [True, False, False])
+            .with_columns(position=pl.int_range(pl.len()))
+            .with_columns((pl.col('position') - pl.when(new_run).then(pl.col('position')).forward_fill() + 1).alias(name))
+            .sort('row')
+            .drop('row', 'position')
+        )
+    return df
+
+
+def _one_context_per_key(df):
+    return (
+        df
+        .with_columns(**{name: expr.over('pid') for name, expr in PID_AGGREGATES.items()})
+        .with_columns(**{name: pl.col('ovr').rank('ordinal', descending=True).over(by) for name, by in RANKS.items()})
+    )
+
+
+@app.command()
+def aggregates(teams: list[int] = [30, 64, 128], repeats: int = 5):
+    """Per-player totals and per-season ranks: separate windows, group_by + sort ranks, one context per key."""
+    for n_teams in teams:
+        league = read_league(write_league(DATA_DIR / 'interim' / f'bench_league_{n_teams}_teams.json', n_teams=n_teams))
+        df = (
+            process_players(league['players'].lazy(), progression.scan_progs(), league['game_settings'])
+            .drop('pot', 'years', 'max_value', 'sum_value')
+            .collect()
+        )
+        for fn in [_separate_windows, _group_by_and_sort_ranks, _one_context_per_key]:
+            seconds = _best_of(lambda: fn(df.lazy()).collect(engine='in-memory'), repeats)
+            logger.info(f'{n_teams:>4} teams ({df.height:>6} rows), {fn.__name__[1:]:>23}: {seconds * 1000:.1f} ms')
+
+
+# %%
+def _progression_notebook(changes):
+    # Algorithm of notebooks/2_calculate_progs.ipynb: every horizon re-evaluates and re-convolves its whole prefix
+    from scipy import signal
+    from scipy.stats import gaussian_kde
+
+    frames = []
+    for position in progression.POSITIONS:
+        kdes = {
+            age: gaussian_kde(changes.filter((pl.col('pos') == position) & (pl.col('age') == age))['ovr_shift'].to_numpy())
+            for age in progression.KDE_AGES
+        }
+        kdes.update({age: kdes[35] for age in range(36, 60)})
+        for age in progression.PROJECTED_AGES:
+            columns = {}
+            for years_in_adv in range(1, progression.HORIZONS + 1):
+                y_convolved = kdes[age](progression.GRID)
+                for kde in [kdes[prior] for prior in range(age + 1, age + years_in_adv)]:
+                    y_convolved = signal.convolve(y_convolved, kde(progression.GRID), mode='same')
+                    y_convolved /= np.trapezoid(y_convolved, progression.GRID)
+                columns[f'y_{years_in_adv}'] = y_convolved
+            frames.append(pl.DataFrame({'x': progression.GRID, **columns, 'position': position, 'age': age}))
+    return pl.concat(frames)
+
+
+@app.command('progression')
+def progression_rebuild(n_teams: int = 128, history_seasons: int = 60):
+    """Rebuild of progression.parquet: the notebook loops versus hgm.data.progression."""
+    league = read_league(write_league(
+        DATA_DIR / 'interim' / f'bench_league_{n_teams}_teams_{history_seasons}_seasons.json',
+        n_teams=n_teams, history_seasons=history_seasons,
+    ))
+    changes = progression.rating_changes(league['players'])
+    logger.info(f'{changes.height} rating changes')
+    results = {}
+    for name, fn in [('notebook', _progression_notebook), ('build_progression', progression.build_progression)]:
+        start = time.perf_counter()
+        results[name] = fn(changes)
+        logger.info(f'{name:>17}: {time.perf_counter() - start:.1f}s')
+    y = [f'y_{years_in_adv}' for years_in_adv in range(1, progression.HORIZONS + 1)]
+    difference = (results['notebook'].select(y) - results['build_progression'].select(y)).select(pl.max_horizontal(pl.all().abs().max()))
+    logger.info(f'Schemas equal: {results["notebook"].schema == results["build_progression"].schema}, max abs difference {difference.item():.2e}')
+
+
+# %%
+def _calculate_progs_exploded(densities, coefficients):
+    # Aggregation of notebooks/2_calculate_progs.ipynb: every density point joined with every ovr
+    horizons = range(1, progression.HORIZONS + 1)
+    return (
+        densities.lazy()
+        .rename({'position': 'pos'})
+        .with_columns(
+            ovr=pl.int_ranges(0, 101),
+        )
+        .explode('ovr')
+        .rename({'x': 'exp_growth'})
+        .with_columns(
+            exp_ovr=pl.col('exp_growth').add(pl.col('ovr')),
+        )
+        .with_columns(
+            exp_value=(
+                pl.col('exp_ovr') * pl.col('pos').replace_strict({pos: model['coef'] for pos, model in coefficients.items()})
+                + pl.col('pos').replace_strict({pos: model['intercept'] for pos, model in coefficients.items()})
+            ).clip(0)
+        )
+        .with_columns(
+            [(pl.col('exp_ovr') * pl.col(f'y_{i}')).alias(f'exp_ovr_{i}') for i in horizons]
+            + [(pl.col('exp_value') * pl.col(f'y_{i}')).alias(f'exp_value_{i}') for i in horizons]
+        )
+        .group_by(['pos', 'age', 'ovr'])
+        .agg(
+            [pl.sum(f'exp_ovr_{i}').alias(f'exp_ovr_product_{i}') for i in horizons]
+            + [pl.sum(f'exp_value_{i}').alias(f'exp_value_product_{i}') for i in horizons]
+            + [pl.sum(f'y_{i}').alias(f'y_{i}') for i in horizons]
+        )
+        .select(
+            ['pos', 'age', 'ovr']
+            + [pl.col(f'exp_ovr_product_{i}').truediv(pl.col(f'y_{i}')).alias(f'exp_ovr_{i}') for i in horizons]
+            + [pl.col(f'exp_value_product_{i}').truediv(pl.col(f'y_{i}')).alias(f'exp_value_{i}') for i in horizons]
+        )
+        .select(pl.concat_list(
+            pl.struct(
+                'pos', 'age', 'ovr', horizon=pl.lit(i),
+                exp_ovr=pl.col(f'exp_ovr_{i}'), exp_value=pl.col(f'exp_value_{i}'),
+            )
+            for i in horizons
+        ).alias('horizons'))
+        .explode('horizons')
+        .unnest('horizons')
+        .cast(progression.PROGS_KEYS)
+        .sort(list(progression.PROGS_KEYS))
+        .collect()
+    )
+
+
+def _calculate_progs(calculate, path):
+    calculate(pl.read_parquet(path), cap_coefficients())
+
+
+@app.command()
+def progs(repeats: int = 3):
+    """Expected ovr/value aggregation: exploding densities against ovr versus matrix products."""
+    engines = {'exploded group_by': _calculate_progs_exploded, 'matrix products': progression.calculate_progs}
+    # Measure before this process starts Polars' thread pool, which the forked workers would inherit
+    for name, calculate in engines.items():
+        runs = [measure(_calculate_progs, calculate, progression.PROGRESSION_PATH) for _ in range(repeats)]
+        logger.info(f'{name:>17}: {min(run[0] for run in runs):.2f}s, peak RSS {max(run[1] for run in runs):.0f} MB')
+    densities = pl.read_parquet(progression.PROGRESSION_PATH)
+    results = {name: calculate(densities, cap_coefficients()) for name, calculate in engines.items()}
+    joined = results['exploded group_by'].join(results['matrix products'], on=list(progression.PROGS_KEYS))
+    difference = max((joined[column] - joined[f'{column}_right']).abs().max() for column in ['exp_ovr', 'exp_value'])
+    logger.info(f'{joined.height} rows matched, max abs difference {difference:.2e}')
+
+
+# %%
+@app.command()
+def simulate(n_teams: int = 32, simulations: list[int] = [1_000, 10_000], workers: list[int] = [1, 4]):
+    """Monte Carlo team value and surplus distributions, in-process and across a process pool."""
+    league = read_league(write_league(DATA_DIR / 'interim' / f'bench_league_{n_teams}_teams.json', n_teams=n_teams))
+    players = load_players(league['players'], load_teams(league['teams']), league['game_settings'])
+    densities = progression.scan_progression().collect()
+    for n_simulations in simulations:
+        for max_workers in workers:
+            start = time.perf_counter()
+            summary = simulation.summarize_simulations(pl.concat(simulation.iter_team_simulations(
+                players, n_simulations, max_workers=max_workers, progression=densities,
+            )))
+            logger.info(
+                f'{n_simulations:>6} simulations, {max_workers} worker(s): {time.perf_counter() - start:.2f}s, '
+                f'peak RSS {_peak_memory_mb():.0f} MB, {summary.height} teams'
+            )
+
+
+# %%
+@app.command()
+def offers(n_teams: int = 128, n_contracts: int = 200_000):
+    """Grade the best offer to every free agent against a synthetic reference of past contracts."""
+    league = read_league(write_league(DATA_DIR / 'interim' / f'bench_league_{n_teams}_teams.json', n_teams=n_teams))
+    players = load_players(league['players'], load_teams(league['teams']), league['game_settings'])
+    season = league['game_settings']['season']
+    rng = np.random.default_rng(0)
+    ecdfs = {
+        'avg_surplus': contracts.ECDF(rng.normal(0, 2, n_contracts)),
+        'total_surplus': contracts.ECDF(rng.normal(0, 10, n_contracts)),
+    }
+    start = time.perf_counter()
+    graded = contracts.grade_free_agents(players, season, ecdfs=ecdfs)
+    logger.info(
+        f'{graded["pid"].n_unique()} free agents x {len(contracts.SALARY_GRID)} salaries x '
+        f'{contracts.MAX_CONTRACT_YEARS} lengths x 2 signing times graded in {time.perf_counter() - start:.2f}s'
+    )
+
+
+@app.command()
+def contract_history(leagues: int = 4, n_teams: int = 32):
+    """Build the reference contracts from several league exports, then update it with nothing new."""
+    sources = [
+        write_league(DATA_DIR / 'interim' / f'bench_league_{n_teams}_teams_seed_{seed}.json', n_teams=n_teams, seed=seed)
+        for seed in range(leagues)
+    ]
+    path = DATA_DIR / 'interim' / 'bench_contracts.parquet'
+    path.unlink(missing_ok=True)
+    for label in ['full build', 'update']:
+        start = time.perf_counter()
+        added = contracts.build_contracts(sources, path, lids=[source.stem for source in sources])
+        logger.info(f'{label}: {added.height} contracts added in {time.perf_counter() - start:.2f}s')
+
+
+# %%
+INTERACTIVE_PAGES = ['1_All.py', '2_Draft.py', '5_Prospects.py', '6_Prospects_v2.py']
+
+
+@app.command()
+def pages(n_teams: int = 32, reruns: int = 5):
+    """Rerun latency of the interactive pages on a processed league, as Streamlit's test runner sees it."""
+    from streamlit.testing.v1 import AppTest
+
+    league = freeze(process_league(
+        write_league(DATA_DIR / 'interim' / f'bench_league_{n_teams}_teams.json', n_teams=n_teams)
+    ))
+    for page in INTERACTIVE_PAGES:
+        app_test = AppTest.from_file(str(PROJ_ROOT / 'pages' / page), default_timeout=300)
+        app_test.session_state['data'] = league
+        app_test.session_state['league_key'] = f'bench-{n_teams}'
+        start = time.perf_counter()
+        app_test.run()
+        first = time.perf_counter() - start
+        # Show every team, so the tables hold the full league
+        for checkbox in app_test.checkbox:
+            if checkbox.label == '*All*':
+                checkbox.check()
+        app_test.run()
+        rerun = _best_of(app_test.run, reruns)
+        errors = ', '.join(exception.message for exception in app_test.exception)
+        logger.info(f'{page:>18}: first run {first * 1000:.0f} ms, rerun {rerun * 1000:.0f} ms {errors}')
+
+
+if __name__ == '__main__':
+    app()
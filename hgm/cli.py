@@ -0,0 +1,205 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import resource
+import shutil
+import time
+import uuid
+
+from loguru import logger
+import polars as pl
+import typer
+
+from hgm.config import DATA_DIR
+
+app = typer.Typer()
+
+# Processed leagues, one league=<file stem> directory each
+LEAGUES_DIR = DATA_DIR / 'processed' / 'leagues'
+
+
+@app.callback()
+def main():
+    """Process league exports without the app."""
+
+
+# %%
+def league_files(paths):
+    """
+    Resolve league exports given as files, directories (every *.json directly inside) or glob
+    patterns.
+
+    :param paths: List of paths or patterns
+    :return: Sorted list of unique Paths
+    """
+    files = set()
+    for path in paths:
+        if Path(path).is_dir():
+            files.update(Path(path).glob('*.json'))
+        elif any(character in path for character in '*?['):
+            files.update(Path(match) for match in glob.glob(path, recursive=True))
+        else:
+            files.add(Path(path))
+    return sorted(files)
+
+
+def write_processed_league(league, out_dir, name):
+    """
+    Write a processed league to out_dir/league=<name>: players partitioned by season, teams and
+    game settings. The directory is staged and swapped in whole, so a league is never read half
+    written and re-running replaces it.
+
+    :param league: Dict with 'game_settings', 'teams' and 'players', see hgm.data.league.process_league
+    :return: Directory written
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    target = out_dir / f'league={name}'
+    staging = out_dir / f'.{name}-{uuid.uuid4().hex}'
+    (staging / 'players').mkdir(parents=True)
+    league['players'].write_parquet(staging / 'players', partition_by='season')
+    league['teams'].write_parquet(staging / 'teams.parquet')
+    (staging / 'game_settings.json').write_text(json.dumps(league['game_settings']))
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    return target
+
+
+def _peak_memory_mb():
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _process_file(path, out_dir):
+    # Runs in a worker; every error is reported back instead of raised, so one bad file fails alone
+    from hgm.data.league import process_league
+
+    start = time.perf_counter()
+    stats = {'file': str(path), 'league': path.stem, 'players': None, 'error': None}
+    try:
+        league = process_league(path)
+        write_processed_league(league, out_dir, path.stem)
+        stats['players'] = league['players'].height
+    except Exception as exception:
+        stats['error'] = f'{type(exception).__name__}: {exception}'
+    return {**stats, 'seconds': time.perf_counter() - start, 'peak_mb': _peak_memory_mb()}
+
+
+def process_files(files, out_dir, workers):
+    """
+    Process league exports across a pool of at most workers processes. Each file gets a fresh
+    worker, so its peak memory is its own and a leak or crash cannot carry over to other files.
+    Polars threads are split between the workers.
+
+    :return: DataFrame of file, league, players, error, seconds and peak_mb, one row per file
+    """
+    # Forking a process that already runs Polars' thread pool can deadlock; start fresh interpreters
+    context = multiprocessing.get_context('spawn')
+    threads = os.environ.get('POLARS_MAX_THREADS')
+    os.environ['POLARS_MAX_THREADS'] = str(max(1, (os.cpu_count() or 1) // workers))
+    rows = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, max_tasks_per_child=1) as executor:
+            futures = {executor.submit(_process_file, path, out_dir): path for path in files}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    stats = future.result()
+                except Exception as exception:
+                    # The worker itself died, e.g. killed for running out of memory
+                    stats = {'file': str(path), 'league': path.stem, 'players': None,
+                             'error': f'{type(exception).__name__}: {exception}', 'seconds': None, 'peak_mb': None}
+                if stats['error']:
+                    logger.error(f'{path.name}: {stats["error"]}')
+                else:
+                    logger.info(
+                        f'{path.name}: {stats["players"]} rows in {stats["seconds"]:.2f}s, '
+                        f'peak RSS {stats["peak_mb"]:.0f} MB'
+                    )
+                rows.append(stats)
+    finally:
+        if threads is None:
+            os.environ.pop('POLARS_MAX_THREADS', None)
+        else:
+            os.environ['POLARS_MAX_THREADS'] = threads
+    return pl.DataFrame(rows, schema={
+        'file': pl.String, 'league': pl.String, 'players': pl.Int64, 'error': pl.String,
+        'seconds': pl.Float64, 'peak_mb': pl.Float64,
+    }).sort('file')
+
+
+# %%
+@app.command()
+def process(paths: list[str], out: Path = LEAGUES_DIR, workers: int = 4):
+    """
+    Process league exports (files, directories or glob patterns) into Parquet under OUT, one
+    league=<file stem> directory each, and write the per-file timings to OUT/stats.parquet.
+    """
+    files = league_files(paths)
+    if not files:
+        raise typer.BadParameter('No league exports found', param_hint='PATHS')
+    stems = pl.Series([path.stem for path in files])
+    if stems.is_duplicated().any():
+        raise typer.BadParameter(f'League names must be unique: {", ".join(stems.filter(stems.is_duplicated()).unique())}')
+
+    start = time.perf_counter()
+    stats = process_files(files, out, max(1, min(workers, len(files))))
+    # Every file may have failed before writing anything
+    Path(out).mkdir(parents=True, exist_ok=True)
+    stats.write_parquet(Path(out) / 'stats.parquet')
+    failed = stats.filter(pl.col('error').is_not_null())
+    logger.info(f'{stats.height - failed.height}/{stats.height} leagues processed in {time.perf_counter() - start:.2f}s')
+    if not failed.is_empty():
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def progs(source: Path = DATA_DIR / 'raw' / 'players.parquet', positions: list[str] | None = None,
+          ages: list[int] | None = None):
+    """
+    Rebuild the progression tables from the rating history in SOURCE, a league export (.json) or
+    raw players (.parquet). Only the (pos, age) samples that changed are refitted, and the new
+    version is published atomically. Narrow the refresh with --positions and --ages.
+    """
+    from hgm.data.ingest import read_league
+    from hgm.data.progression import PROGS_DIR, update_progs
+
+    if not source.exists():
+        raise typer.BadParameter(f'{source} does not exist', param_hint='SOURCE')
+    players = pl.scan_parquet(source) if source.suffix == '.parquet' else read_league(source)['players']
+
+    start = time.perf_counter()
+    rebuilt = update_progs(players, positions=positions or None, ages=ages or None)
+    for position, stale in rebuilt.items():
+        if stale:
+            logger.info(f'{position}: rebuilt ages {min(stale)}-{max(stale)}')
+    logger.info(f'Progression tables in {PROGS_DIR} up to date in {time.perf_counter() - start:.2f}s')
+
+
+@app.command()
+def contracts(paths: list[str], lid: str | None = None):
+    """
+    Add the completed contracts of league exports to the reference contracts the Signings page
+    grades against. Pass --lid to file every export under one league id, e.g. the seasons of one
+    league that its default id would confuse with another.
+    """
+    from hgm.data.contracts import CONTRACTS_PATH, build_contracts
+
+    files = league_files(paths)
+    if not files:
+        raise typer.BadParameter('No league exports found', param_hint='PATHS')
+
+    start = time.perf_counter()
+    try:
+        added = build_contracts(files, lids=None if lid is None else [lid] * len(files))
+    except ValueError as error:
+        logger.error(error)
+        raise typer.Exit(code=1)
+    logger.info(f'{added.height} contracts added to {CONTRACTS_PATH} in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    app()
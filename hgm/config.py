@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -13,6 +14,13 @@ PARAMS_DIR = PROJ_ROOT / "params"
 MODELS_DIR = PROJ_ROOT / "models"
 DATA_FILEPATH = "C:/Users/jrnas/Downloads/ZGMH_NHL_2023_playoffs_Round_1.json"
 
+# Evaluate the cap value and salary models through precomputed lookup tables
+COMPILED_MODELS = os.getenv("HGM_COMPILED_MODELS", "1") == "1"
+
+# Processed leagues, keyed by league file hash and model/constants versions
+LEAGUE_CACHE_DIR = DATA_DIR / "interim" / "league_cache"
+LEAGUE_CACHE_MAX_MB = int(os.getenv("HGM_LEAGUE_CACHE_MAX_MB", 2048))
+
 # If tqdm is installed, configure loguru with tqdm.write
 # https://github.com/Delgan/loguru/issues/135
 try:
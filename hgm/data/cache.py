@@ -0,0 +1,149 @@
+# %%
+from functools import lru_cache
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+import shutil
+import uuid
+
+import polars as pl
+
+from hgm.config import DATA_DIR, LEAGUE_CACHE_DIR, LEAGUE_CACHE_MAX_MB, MODELS_DIR
+
+# Bump whenever the processing pipeline changes the players/teams it produces
+CACHE_VERSION = 4
+
+ARTIFACT_DIRS = [DATA_DIR / 'constants', MODELS_DIR]
+
+
+# %%
+@lru_cache(maxsize=None)
+def _file_digest(path, mtime_ns, size):
+    with open(path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def artifacts_version():
+    """
+    Hash of every constants file and model the pipeline reads. Files are only re-hashed when
+    their mtime or size changes.
+    """
+    digest = hashlib.sha256(str(CACHE_VERSION).encode())
+    for directory in ARTIFACT_DIRS:
+        for path in sorted(directory.rglob('*')):
+            if path.is_file() and not path.name.startswith('.'):
+                stat = path.stat()
+                digest.update(str(path.relative_to(directory)).encode())
+                digest.update(_file_digest(path, stat.st_mtime_ns, stat.st_size).encode())
+    return digest.hexdigest()
+
+
+def league_hash(source):
+    """
+    Hash of the raw bytes of a league export.
+
+    :param source: Path to a JSON file, raw bytes, or a file-like object
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as file:
+            return hashlib.file_digest(file, 'sha256').hexdigest()
+    if isinstance(source, io.BytesIO):
+        return hashlib.sha256(source.getbuffer()).hexdigest()
+    if hasattr(source, 'read'):
+        position = source.tell()
+        digest = hashlib.file_digest(source, 'sha256').hexdigest()
+        source.seek(position)
+        return digest
+    return hashlib.sha256(source).hexdigest()
+
+
+def league_key(source):
+    """Cache key of a league export: its content hash combined with the artifacts version."""
+    return f'{league_hash(source)[:32]}-{artifacts_version()[:16]}'
+
+
+# %%
+def _entries():
+    if not LEAGUE_CACHE_DIR.exists():
+        return []
+    return [path for path in LEAGUE_CACHE_DIR.iterdir() if path.is_dir() and not path.name.startswith('.')]
+
+
+def _size(path):
+    return sum(file.stat().st_size for file in path.iterdir())
+
+
+def load_league(key):
+    """
+    Load a processed league from the cache.
+
+    :param key: Key returned by league_key
+    :return: Dict with 'game_settings', 'teams' and 'players', or None on a cache miss
+    """
+    entry = LEAGUE_CACHE_DIR / key
+    try:
+        league = {
+            'game_settings': json.loads((entry / 'game_settings.json').read_text()),
+            'teams': pl.read_ipc((entry / 'teams.arrow').read_bytes()),
+            'players': pl.read_ipc((entry / 'players.arrow').read_bytes()),
+        }
+    except (FileNotFoundError, OSError, pl.exceptions.ComputeError):
+        return None
+    # Directory mtime doubles as the last-used time for LRU eviction
+    os.utime(entry)
+    return league
+
+
+def save_league(key, league, max_mb=LEAGUE_CACHE_MAX_MB):
+    """
+    Write a processed league to the cache, then evict entries built from other artifact
+    versions and the least recently used entries above max_mb.
+    """
+    LEAGUE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    staging = LEAGUE_CACHE_DIR / f'.{key}-{uuid.uuid4().hex}'
+    staging.mkdir()
+    (staging / 'game_settings.json').write_text(json.dumps(league['game_settings']))
+    league['teams'].write_ipc(staging / 'teams.arrow', compression='lz4')
+    league['players'].write_ipc(staging / 'players.arrow', compression='lz4')
+    try:
+        os.replace(staging, LEAGUE_CACHE_DIR / key)
+    except OSError:
+        # Another session cached the same league first
+        shutil.rmtree(staging, ignore_errors=True)
+    evict(max_mb)
+
+
+def evict(max_mb=LEAGUE_CACHE_MAX_MB):
+    version = artifacts_version()[:16]
+    entries = []
+    for entry in _entries():
+        if not entry.name.endswith(version):
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            entries.append((entry.stat().st_mtime, _size(entry), entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_mb * 2 ** 20:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def cached_league(source, process, key=None):
+    """
+    Return the processed league for source, running process(source) only on a cache miss.
+
+    :param source: Path to a JSON file, raw bytes, or a file-like object
+    :param process: Function turning source into a dict of 'game_settings', 'teams' and 'players'
+    :param key: Precomputed league_key(source), if already known
+    :return: (key, league)
+    """
+    key = key or league_key(source)
+    league = load_league(key)
+    if league is None:
+        league = process(source)
+        save_league(key, league)
+    return key, league
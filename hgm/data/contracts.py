@@ -0,0 +1,420 @@
+# %%
+from functools import lru_cache
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from hgm.config import DATA_DIR
+from hgm.data.ingest import PLAYER_SCHEMA, export_spans, iter_records, open_league, read_game_settings
+from hgm.models import cap_table
+
+CONTRACTS_PATH = DATA_DIR / 'processed' / 'contracts.parquet'
+SURPLUS_METRICS = ['avg_surplus', 'total_surplus']
+# Lowest percentile earning each grade, best first; anything below the last is an F
+GRADE_THRESHOLDS = {'A+': 95, 'A': 90, 'B': 75, 'C': 50, 'D': 25}
+GRADE_DTYPE = pl.Enum([*GRADE_THRESHOLDS, 'F'])
+
+
+# %%
+class ECDF:
+    """
+    Empirical CDF of a sample, held sorted so each query is a binary search instead of a scan.
+    Missing values of the sample count towards its size but are never below a query.
+    """
+
+    def __init__(self, sample):
+        sample = np.asarray(sample, dtype=np.float64)
+        self.size = len(sample)
+        self._sorted = np.sort(sample[~np.isnan(sample)])
+
+    def percentile(self, values):
+        """
+        Share of the sample strictly below each value, in percent.
+
+        :param values: Scalar or array of values
+        :return: Array of percentiles between 0 and 100; NaN where the value is missing
+        """
+        values = np.asarray(values, dtype=np.float64)
+        below = np.searchsorted(self._sorted, values, side='left')
+        return np.where(np.isnan(values), np.nan, below / max(self.size, 1) * 100)
+
+
+@lru_cache(maxsize=4)
+def _contract_ecdfs(path, mtime_ns):
+    contracts = pl.read_parquet(path, columns=SURPLUS_METRICS)
+    return {metric: ECDF(contracts[metric].cast(pl.Float64).to_numpy()) for metric in SURPLUS_METRICS}
+
+
+def contract_ecdfs(path=CONTRACTS_PATH):
+    """
+    ECDF of every SURPLUS_METRICS column of the reference contracts. Built once per version of
+    the file: rewriting it changes its mtime and the next call rebuilds.
+
+    :return: Dict of metric -> ECDF
+    """
+    return _contract_ecdfs(str(path), path.stat().st_mtime_ns)
+
+
+def letter_grades(percentiles):
+    """Letter grade of each percentile, see GRADE_THRESHOLDS; missing percentiles grade F."""
+    percentiles = np.atleast_1d(np.asarray(percentiles, dtype=np.float64))
+    # Thresholds run best first, so the number met counts grades up from F
+    met = sum((percentiles >= threshold).astype(np.uint8) for threshold in GRADE_THRESHOLDS.values())
+    return pl.Series('grade', len(GRADE_THRESHOLDS) - met).replace_strict(
+        range(len(GRADE_DTYPE.categories)), GRADE_DTYPE.categories, return_dtype=GRADE_DTYPE
+    )
+
+
+def grade_contracts(avg_surplus, total_surplus, ecdfs=None):
+    """
+    Grade contracts against the reference contracts. A contract is graded on the better of its
+    average and total surplus percentiles.
+
+    :param avg_surplus: Array of surplus per season of each contract
+    :param total_surplus: Array of total surplus of each contract
+    :param ecdfs: See contract_ecdfs; defaults to the published contracts
+    :return: DataFrame of avg_percentile, total_percentile and grade, one row per contract
+    """
+    ecdfs = ecdfs or contract_ecdfs()
+    avg_percentile = ecdfs['avg_surplus'].percentile(avg_surplus)
+    total_percentile = ecdfs['total_surplus'].percentile(total_surplus)
+    return pl.DataFrame({
+        'avg_percentile': np.atleast_1d(avg_percentile),
+        'total_percentile': np.atleast_1d(total_percentile),
+        'grade': letter_grades(np.fmax(avg_percentile, total_percentile)),
+    })
+
+
+# %%
+# Offers the Signings page lets the user type: 0 to 14M in steps of 0.1M, for 1 to 8 seasons
+SALARY_GRID = np.round(np.arange(0, 140.5) / 10, 1)
+MAX_CONTRACT_YEARS = 8
+
+
+def evaluate_offers(values, pids=None, salaries=SALARY_GRID, max_years=MAX_CONTRACT_YEARS, ecdfs=None):
+    """
+    Surplus and grade of every offer on a (salary x years x in-season) grid, for one or many
+    players, in one broadcast. An in-season offer starts paying in the current season, an
+    off-season offer in the next one. Seasons past a player's projection count towards neither
+    the cost nor the value.
+
+    :param values: Array of projected value by season, current season first; 2D for several
+        players, one row each, NaN-padded
+    :param pids: Label of each row of values; defaults to the row number
+    :param salaries: Salaries to evaluate, in millions
+    :param ecdfs: See contract_ecdfs; defaults to the published contracts
+    :return: DataFrame of pid, in_season, years, salary, total_cost, total_value, avg_surplus,
+        total_surplus, avg_percentile, total_percentile and grade, one row per offer
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    salaries = np.asarray(salaries, dtype=np.float64)
+    pids = np.arange(len(values)) if pids is None else np.asarray(pids)
+    years = np.arange(1, max_years + 1)
+
+    # Value of the first 1..max_years seasons of each contract: (players, in_season, years)
+    windows = np.full((len(values), 2, max_years), np.nan)
+    for in_season, start in enumerate([1, 0]):
+        window = values[:, start:start + max_years]
+        windows[:, in_season, :window.shape[1]] = window
+    total_value = np.nancumsum(windows, axis=-1)
+    seasons = np.cumsum(~np.isnan(windows), axis=-1)
+
+    # (players, in_season, years, salaries); only the projected seasons are paid for, as only
+    # they are valued
+    total_cost = seasons[..., None] * salaries
+    total_surplus = total_value[..., None] - total_cost
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_surplus = np.where(seasons[..., None] > 0, total_surplus / seasons[..., None], np.nan)
+    shape = total_surplus.shape
+
+    grades = grade_contracts(avg_surplus.ravel(), total_surplus.ravel(), ecdfs)
+    return pl.DataFrame({
+        'pid': np.broadcast_to(pids[:, None, None, None], shape).ravel(),
+        'in_season': np.broadcast_to(np.array([False, True])[:, None, None], shape).ravel(),
+        'years': np.broadcast_to(years[:, None], shape).ravel(),
+        'salary': np.broadcast_to(salaries, shape).ravel(),
+        'total_cost': total_cost.ravel(),
+        'total_value': np.broadcast_to(total_value[..., None], shape).ravel(),
+        'avg_surplus': avg_surplus.ravel(),
+        'total_surplus': total_surplus.ravel(),
+    }).hstack(grades)
+
+
+def grade_salaries(offers):
+    """
+    Highest salary still earning each grade or better, for every contract length. Grades only
+    improve as the salary drops, so this is the most each grade can be bought for.
+
+    :param offers: See evaluate_offers
+    :return: DataFrame of pid, in_season, years and one column per grade of GRADE_THRESHOLDS,
+        null where the grade is out of reach even at the lowest salary
+    """
+    rank = pl.col('grade').to_physical()
+    return (
+        offers
+        .group_by('pid', 'in_season', 'years', maintain_order=True)
+        .agg(
+            pl.col('salary').filter(rank <= grade_rank).max().alias(grade)
+            for grade_rank, grade in enumerate(GRADE_THRESHOLDS)
+        )
+    )
+
+
+def best_offers(offers, min_salary=None):
+    """
+    Offer of the most total surplus of every player and signing time, among those paying at least
+    the player's minimum salary.
+
+    :param offers: See evaluate_offers
+    :param min_salary: DataFrame of pid and min_salary, e.g. free agents' asking amounts; None for
+        no minimum beyond the grid
+    :return: DataFrame of offers, one row per (pid, in_season)
+    """
+    if min_salary is not None:
+        offers = (
+            offers
+            .join(min_salary, on='pid', how='left')
+            .filter(pl.col('salary') >= pl.col('min_salary').fill_null(0))
+            .drop('min_salary')
+        )
+    return (
+        offers
+        .filter(pl.col('total_surplus') == pl.col('total_surplus').max().over('pid', 'in_season'))
+        .unique(['pid', 'in_season'], keep='first', maintain_order=True)
+        .sort('pid', 'in_season')
+    )
+
+
+def grade_free_agents(players, season, ecdfs=None):
+    """
+    Best offer to every free agent (tid -1) in a season, all graded in one batch. An agent's
+    current salary is their asking amount, the least they accept.
+
+    :param players: Processed players, see hgm.data.league.load_players
+    :return: DataFrame of player and the offer columns of evaluate_offers, one row per
+        (pid, in_season), best first
+    """
+    free_agents = players.filter((pl.col('season') == season) & (pl.col('tid') == -1))
+    trajectories = (
+        players
+        .filter(pl.col('pid').is_in(free_agents['pid'].implode()) & (pl.col('season') >= season))
+        .with_columns(offset=(pl.col('season') - season).cast(pl.Int64))
+    )
+    pids = free_agents['pid'].sort().to_numpy()
+    values = np.full((len(pids), trajectories['offset'].max() + 1 if len(pids) else 1), np.nan)
+    values[np.searchsorted(pids, trajectories['pid'].to_numpy()), trajectories['offset'].to_numpy()] = (
+        trajectories['value'].cast(pl.Float64).fill_null(np.nan).to_numpy()
+    )
+
+    asking = free_agents.select('pid', min_salary=pl.col('salary'))
+    return (
+        best_offers(evaluate_offers(values, pids=pids, ecdfs=ecdfs), asking)
+        .join(free_agents.select('pid', 'player'), on='pid')
+        .select('player', pl.exclude('player'))
+        .sort('total_surplus', descending=True)
+    )
+
+
+# %%
+# A contract is identified by its league, its player and the season it starts paying
+CONTRACT_KEYS = ['league_id', 'pid', 'season']
+CONTRACT_SCHEMA = pl.Schema({
+    'league_id': pl.String,
+    'pid': pl.Int64,
+    'season': pl.Int64,
+    'pos': pl.String,
+    'age': pl.Int64,
+    'ovr': pl.Int64,
+    'years': pl.UInt32,
+    'salary': pl.Float64,
+    'total_cost': pl.Float64,
+    'total_value': pl.Float64,
+    'avg_surplus': pl.Float64,
+    'total_surplus': pl.Float64,
+})
+
+
+def league_id(meta, game_settings):
+    """
+    Identifier shared by every export of a league: its name, the season it started in and the
+    team the user first managed. Leagues started from the same file under the same name and team
+    share it; give those explicit ids, see build_contracts.
+
+    :param meta: 'meta' object of the export; None if it has none
+    :param game_settings: Game settings of the export
+    :return: Hex string
+    """
+    user_tid = game_settings.get('userTid')
+    if isinstance(user_tid, list):
+        user_tid = user_tid[0]['value'] if user_tid else None
+    identity = [(meta or {}).get('name'), game_settings.get('startingSeason'), user_tid]
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()[:16]
+
+
+def contracts_query(player_data, lid, season):
+    """
+    Lazy query graph from raw players to the contracts they completed before season. A contract
+    starts whenever a player's salary changes and runs while it stays the same; its realized value
+    is the cap value of the player's ovr in each of its seasons.
+
+    :param player_data: Raw players, see hgm.data.ingest.PLAYER_SCHEMA
+    :param lid: League id, see league_id
+    :param season: Current season of the league; contracts still running are left out
+    :return: LazyFrame of CONTRACT_SCHEMA
+    """
+    players_raw = player_data.lazy()
+    ratings = (
+        players_raw
+        .select('pid', 'born', 'ratings')
+        .explode('ratings')
+        .unnest('ratings')
+        .group_by('pid', 'season')
+        .agg(
+            pl.col('pos').last(),
+            pl.col('ovr').last(),
+            age=(pl.col('season') - pl.col('born').struct.field('year')).last(),
+        )
+        .join(cap_table().lazy(), on=['pos', 'ovr'], how='left')
+    )
+    salaries = (
+        players_raw
+        .select('pid', 'salaries')
+        .explode('salaries')
+        .unnest('salaries')
+        .drop_nulls('season')
+        .group_by('pid', 'season')
+        .agg(salary=pl.col('amount').last() / 1000)
+        .with_columns(
+            # Same rule as the salary notebook: the salary changing marks a new contract
+            contract=(
+                (pl.col('salary') != pl.col('salary').shift(1)).fill_null(True).cum_sum()
+                .over('pid', order_by='season')
+            ),
+        )
+    )
+    # The streaming engine does not keep row order through joins, so every aggregate below
+    # orders by season itself
+    return (
+        salaries
+        .join(ratings, on=['pid', 'season'], how='left')
+        .group_by('pid', 'contract')
+        .agg(
+            pl.col('pos', 'age', 'ovr', 'salary').sort_by('season').first(),
+            pl.col('season').min(),
+            years=pl.len(),
+            last_season=pl.col('season').max(),
+            total_value=pl.col('cap_value').sum(),
+        )
+        .filter(pl.col('last_season') < season)
+        .with_columns(
+            league_id=pl.lit(lid),
+            total_cost=pl.col('salary') * pl.col('years'),
+        )
+        .with_columns(total_surplus=pl.col('total_value') - pl.col('total_cost'))
+        .with_columns(avg_surplus=pl.col('total_surplus') / pl.col('years'))
+        .select(pl.col(name).cast(dtype) for name, dtype in CONTRACT_SCHEMA.items())
+    )
+
+
+def scan_league_contracts(source, lid=None, batch_size=10_000):
+    """
+    Contracts of one league export. Players are decoded in batches; each batch holds every
+    season of its players, so their contracts never span batches.
+
+    :param source: Path to a JSON file, raw bytes, or a file-like object
+    :param lid: League id of the export; defaults to its league_id
+    :param batch_size: Number of players decoded at once
+    :return: LazyFrame of CONTRACT_SCHEMA
+    """
+    buf = open_league(source)
+    spans = export_spans(buf, source)
+    game_settings = read_game_settings(buf, spans['gameAttributes'])
+    if lid is None:
+        meta = json.loads(bytes(buf[spans['meta'][0]:spans['meta'][1] + 1])) if 'meta' in spans else None
+        lid = league_id(meta, game_settings)
+    # Each batch is reduced to its contracts before the next is decoded, so only one batch of
+    # players is held at a time
+    contracts = [
+        contracts_query(batch, lid, game_settings['season']).collect(engine='streaming')
+        for batch in iter_records(buf, spans['players'], PLAYER_SCHEMA, batch_size)
+    ]
+    return pl.concat([pl.DataFrame(schema=CONTRACT_SCHEMA), *contracts]).lazy()
+
+
+def _colliding_leagues(contracts, existing):
+    """
+    League ids under which two different contracts share a key: within contracts, or between
+    contracts and existing. Exports of one league always agree on a contract's terms, so this
+    means two leagues were given the same id.
+    """
+    terms = ['age', 'salary']
+    within = (
+        contracts
+        .group_by(CONTRACT_KEYS)
+        .agg(versions=pl.struct(terms).n_unique())
+        .filter(pl.col('versions') > 1)
+    )
+    against = (
+        contracts.lazy()
+        .join(existing.select(*CONTRACT_KEYS, *terms), on=CONTRACT_KEYS, suffix='_held')
+        .filter(pl.any_horizontal(pl.col(term).ne_missing(pl.col(f'{term}_held')) for term in terms))
+        .collect(engine='streaming')
+    )
+    return sorted(set(within['league_id']) | set(against['league_id']))
+
+
+def build_contracts(sources, path=CONTRACTS_PATH, lids=None, batch_size=10_000):
+    """
+    Add the completed contracts of league exports to the reference contracts, skipping those
+    already in it by CONTRACT_KEYS. Re-running after each season only appends that season's
+    expired contracts. The file is replaced atomically, and only when something was added, so
+    contract_ecdfs rebuilds exactly when the reference changes.
+
+    :param sources: One or several league exports, see scan_league_contracts
+    :param path: Parquet file of the reference contracts, created if missing
+    :param lids: League id of each source, e.g. the same id for the seasons of one league; None
+        for the league_id of every source, or None for some of them
+    :return: DataFrame of the contracts added
+    :raise ValueError: If a league's contracts collide with those of another league under the
+        same id; nothing is written then
+    """
+    if isinstance(sources, (str, Path, bytes)) or hasattr(sources, 'read'):
+        sources = [sources]
+    sources = list(sources)
+    lids = [None] * len(sources) if lids is None else list(lids)
+    if len(lids) != len(sources):
+        raise ValueError(f'{len(lids)} league ids given for {len(sources)} exports')
+    if not sources:
+        return pl.DataFrame(schema=CONTRACT_SCHEMA)
+
+    path = Path(path)
+    existing = pl.scan_parquet(path) if path.exists() else pl.LazyFrame(schema=CONTRACT_SCHEMA)
+    contracts = pl.concat([
+        scan_league_contracts(source, lid, batch_size) for source, lid in zip(sources, lids)
+    ]).collect(engine='streaming')
+
+    colliding = _colliding_leagues(contracts, existing)
+    if colliding:
+        raise ValueError(
+            f'Contracts of different leagues share the league ids {", ".join(colliding)}; '
+            'pass a distinct id for each league'
+        )
+
+    added = (
+        contracts.lazy()
+        .unique(CONTRACT_KEYS, keep='first', maintain_order=True)
+        .join(existing.select(CONTRACT_KEYS), on=CONTRACT_KEYS, how='anti')
+        .collect(engine='streaming')
+    )
+    if added.is_empty():
+        return added
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    pl.concat([existing, added.lazy()]).sink_parquet(staging, engine='streaming')
+    os.replace(staging, path)
+    return added
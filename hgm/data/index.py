@@ -0,0 +1,63 @@
+# %%
+import numpy as np
+import polars as pl
+
+
+# %%
+class PlayerIndex:
+    """
+    Read-only index of processed players for single-season and single-player lookups. Rows are
+    sorted by (pid, season) once; each player's seasons are then a contiguous row range found by
+    binary search, and each season is its own frame, sorted by pid, so reading one season or one
+    player never scans the other rows.
+    """
+
+    def __init__(self, players):
+        """
+        :param players: Processed players, see hgm.data.league.load_players
+        """
+        self.frame = players.sort('pid', 'season').rechunk()
+        pids = self.frame['pid'].to_numpy()
+        self._pids, self._starts = np.unique(pids, return_index=True)
+        self._ends = np.append(self._starts[1:], len(pids))
+        self._seasons = {
+            season: (frame, frame['pid'].to_numpy())
+            for (season,), frame in self.frame.partition_by('season', as_dict=True, maintain_order=True).items()
+        }
+
+    @property
+    def seasons(self):
+        return sorted(self._seasons)
+
+    def _position(self, sorted_pids, pid):
+        position = np.searchsorted(sorted_pids, pid)
+        if position < len(sorted_pids) and sorted_pids[position] == pid:
+            return position
+        return None
+
+    def season(self, season):
+        """All players in one season, sorted by pid; empty if the season is not projected."""
+        if season not in self._seasons:
+            return self.frame.clear()
+        return self._seasons[season][0]
+
+    def player(self, pid):
+        """Every season of one player, sorted by season; empty for an unknown pid."""
+        position = self._position(self._pids, pid)
+        if position is None:
+            return self.frame.clear()
+        return self.frame.slice(self._starts[position], self._ends[position] - self._starts[position])
+
+    def players(self, pids, season=None):
+        """
+        Rows of several players, in the order of pids; unknown pids are skipped.
+
+        :param season: Only this season's row of each player; None for every season
+        """
+        if season is None:
+            frames = [self.player(pid) for pid in pids]
+            return pl.concat(frames) if frames else self.frame.clear()
+
+        frame, season_pids = self._seasons.get(season, (self.frame.clear(), np.array([], dtype=np.int64)))
+        positions = [self._position(season_pids, pid) for pid in pids]
+        return frame[np.array([position for position in positions if position is not None], dtype=np.int64)]
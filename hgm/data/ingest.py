@@ -0,0 +1,229 @@
+# %%
+import io
+import json
+import mmap
+from pathlib import Path
+import re
+
+import numpy as np
+import polars as pl
+
+# Only the parts of a league export that the app reads. Everything else (box scores, events,
+# player stats, ...) is skipped without ever being decoded.
+LEAGUE_KEYS = ('gameAttributes', 'teams', 'players')
+
+PLAYER_SCHEMA = pl.Schema({
+    'pid': pl.Int64,
+    'tid': pl.Int64,
+    'firstName': pl.String,
+    'lastName': pl.String,
+    'born': pl.Struct({'year': pl.Int64, 'loc': pl.String}),
+    'draft': pl.Struct({'year': pl.Int64}),
+    'ratings': pl.List(pl.Struct({'season': pl.Int64, 'pos': pl.String, 'ovr': pl.Int64})),
+    'salaries': pl.List(pl.Struct({'season': pl.Int64, 'amount': pl.Float64})),
+})
+
+TEAM_SCHEMA = pl.Schema({
+    'tid': pl.Int64,
+    'abbrev': pl.String,
+    'disabled': pl.Boolean,
+})
+
+_QUOTE, _BACKSLASH = ord('"'), ord('\\')
+_OPEN_BRACE, _OPEN_BRACKET, _CLOSE_BRACE, _CLOSE_BRACKET = b'{[}]'
+_KEY = re.compile(rb'"([^"\\]*)"\s*:\s*$')
+
+
+# %%
+def open_league(source):
+    """
+    Return a zero-copy buffer over a league export.
+
+    :param source: Path to a JSON file, raw bytes, or a file-like object (e.g. a Streamlit upload)
+    :return: Object supporting the buffer protocol
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if isinstance(source, io.BytesIO):
+        return source.getbuffer()
+    if hasattr(source, 'read'):
+        return source.read()
+    return source
+
+
+def _brackets(buf, start, stop, max_depth, chunk_size=1 << 24):
+    """
+    Find the brackets outside of strings in buf[start:stop] that sit at a nesting depth below
+    max_depth (relative to start). The buffer is scanned in fixed-size chunks with NumPy so memory
+    stays bounded regardless of the file size.
+
+    :return: (positions, depths, is_open) arrays
+    :raise ValueError: If the brackets of buf[start:stop] do not balance, e.g. a truncated file
+    """
+    # Seeded with empty arrays so an empty range concatenates to empty arrays
+    positions, depths, opens = [np.empty(0, np.int64)], [np.empty(0, np.int64)], [np.empty(0, bool)]
+    depth, in_string = 0, 0
+    while start < stop:
+        end = min(start + chunk_size, stop)
+        # Never split a chunk right after a backslash so escapes can be resolved locally
+        while end < stop and buf[end - 1] == _BACKSLASH:
+            end += 1
+        chunk = np.frombuffer(buf, np.uint8, end - start, start)
+
+        quotes = np.flatnonzero(chunk == _QUOTE)
+        escaped = np.zeros(len(quotes), dtype=bool)
+        preceding = quotes >= 1
+        k = 1
+        while preceding.any():
+            preceding &= chunk[np.where(preceding, quotes - k, 0)] == _BACKSLASH
+            escaped ^= preceding
+            k += 1
+            preceding &= quotes >= k
+        quotes = quotes[~escaped]
+
+        found = np.flatnonzero(
+            (chunk == _OPEN_BRACE) | (chunk == _OPEN_BRACKET) | (chunk == _CLOSE_BRACE) | (chunk == _CLOSE_BRACKET)
+        )
+        found = found[(np.searchsorted(quotes, found) + in_string) % 2 == 0]
+        is_open = (chunk[found] == _OPEN_BRACE) | (chunk[found] == _OPEN_BRACKET)
+        after = depth + np.cumsum(np.where(is_open, 1, -1))
+        if len(after) and after.min() < 0:
+            raise ValueError('Unbalanced brackets')
+        before = np.where(is_open, after - 1, after)
+        keep = before < max_depth
+
+        positions.append(found[keep] + start)
+        depths.append(before[keep])
+        opens.append(is_open[keep])
+        if len(after):
+            depth = int(after[-1])
+        in_string = (in_string + len(quotes)) % 2
+        start = end
+
+    if depth or in_string:
+        raise ValueError('Unbalanced brackets')
+    return np.concatenate(positions), np.concatenate(depths), np.concatenate(opens)
+
+
+def _spans(buf, start, stop, depth):
+    """(open, close) positions of every container value at the given depth of buf[start:stop]."""
+    positions, depths, is_open = _brackets(buf, start, stop, depth + 1)
+    at_depth = depths == depth
+    return np.column_stack([positions[at_depth & is_open], positions[at_depth & ~is_open]])
+
+
+def _key(buf, position):
+    """Name of the object key whose value opens at position, if any."""
+    match = _KEY.search(bytes(buf[max(position - 128, 0):position]))
+    return match.group(1).decode() if match else None
+
+
+def league_spans(buf):
+    """
+    Locate the top-level values of a league export.
+
+    :return: Dict of key -> (open, close) byte positions for every top-level array/object
+    """
+    return {_key(buf, start): (start, stop) for start, stop in _spans(buf, 0, len(buf), 1).tolist()}
+
+
+def export_spans(buf, source=None):
+    """
+    league_spans of a league export, checked to be complete: the brackets balance and every value
+    of LEAGUE_KEYS is there.
+
+    :param source: What buf was opened from, named in the error
+    :raise ValueError: If buf is truncated, malformed or not a league export
+    """
+    name = getattr(source, 'name', None) or (source if isinstance(source, (str, Path)) else 'league')
+    try:
+        spans = league_spans(buf)
+    except ValueError as error:
+        raise ValueError(f'{name}: not a valid league export ({error})') from error
+    missing = [key for key in LEAGUE_KEYS if key not in spans]
+    if missing:
+        raise ValueError(f'{name}: not a valid league export, missing: {", ".join(missing)}')
+    return spans
+
+
+# %%
+def _project(buf, start, stop, fields, min_cut):
+    """
+    Yield the elements of the array buf[start:stop] as JSON bytes, with every large
+    nested value whose key is not in fields replaced by null.
+    """
+    positions, depths, is_open = _brackets(buf, start + 1, stop, 2)
+    elements = np.column_stack([positions[(depths == 0) & is_open], positions[(depths == 0) & ~is_open]])
+    values = np.column_stack([positions[(depths == 1) & is_open], positions[(depths == 1) & ~is_open]])
+    values = values[values[:, 1] - values[:, 0] >= min_cut]
+    owners = np.searchsorted(elements[:, 0], values[:, 0], side='right') - 1
+
+    cuts = {}
+    for (value_start, value_stop), owner in zip(values.tolist(), owners.tolist()):
+        if _key(buf, value_start) not in fields:
+            cuts.setdefault(owner, []).append((value_start, value_stop))
+
+    for i, (element_start, element_stop) in enumerate(elements.tolist()):
+        parts, last = [], element_start
+        for value_start, value_stop in cuts.get(i, []):
+            parts += [buf[last:value_start], b'null']
+            last = value_stop + 1
+        parts.append(buf[last:element_stop + 1])
+        yield b''.join(parts)
+
+
+def iter_records(buf, span, schema, batch_size=10_000, min_cut=256):
+    """
+    Parse the array at span in batches, keeping only the fields in schema.
+
+    :param buf: Buffer returned by open_league
+    :param span: (open, close) positions of the array, see league_spans
+    :param schema: Polars schema of the fields to keep
+    :param batch_size: Number of elements decoded at once; bounds peak memory
+    :param min_cut: Nested values smaller than this many bytes are left for Polars to skip
+    :return: Iterator of DataFrames
+    """
+    batch = []
+    for record in _project(buf, *span, set(schema.names()), min_cut):
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield pl.read_json(io.BytesIO(b'[' + b','.join(batch) + b']'), schema=schema)
+            batch = []
+    if batch:
+        yield pl.read_json(io.BytesIO(b'[' + b','.join(batch) + b']'), schema=schema)
+
+
+def iter_players(source, batch_size=10_000):
+    """Stream the players of a league export as DataFrames of at most batch_size rows."""
+    buf = open_league(source)
+    yield from iter_records(buf, export_spans(buf, source)['players'], PLAYER_SCHEMA, batch_size)
+
+
+def read_game_settings(buf, span):
+    game_settings = json.loads(bytes(buf[span[0]:span[1] + 1]))
+    # Older exports store gameAttributes as a list of {key, value} records
+    if isinstance(game_settings, list):
+        game_settings = {attribute['key']: attribute['value'] for attribute in game_settings}
+    return game_settings
+
+
+def read_league(source, batch_size=10_000):
+    """
+    Read the game settings, teams and players of a league export without parsing the rest of it.
+
+    :param source: Path to a JSON file, raw bytes, or a file-like object
+    :param batch_size: Number of players decoded at once
+    :return: Dict with 'game_settings' (dict), 'teams' and 'players' (raw Polars DataFrames)
+    """
+    buf = open_league(source)
+    spans = export_spans(buf, source)
+
+    players = pl.concat(
+        list(iter_records(buf, spans['players'], PLAYER_SCHEMA, batch_size)) or [pl.DataFrame(schema=PLAYER_SCHEMA)]
+    )
+    return {
+        'game_settings': read_game_settings(buf, spans['gameAttributes']),
+        'teams': pl.read_json(io.BytesIO(buf[spans['teams'][0]:spans['teams'][1] + 1]), schema=TEAM_SCHEMA),
+        'players': players,
+    }
@@ -0,0 +1,113 @@
+# %%
+import polars as pl
+
+from hgm.data.ingest import read_league
+from hgm.data.process_data import process_players
+from hgm.data.progression import percentile_columns, scan_progs, scan_quantiles
+
+# Depth chart of a single team: position -> (players per team, label) from the top down.
+# Players ranked below every slot are 'Reserve'.
+LINE_SLOTS = {
+    'C': [(1, '1st Line'), (1, '2nd Line'), (1, '3rd Line'), (1, '4th Line')],
+    'W': [(2, '1st Line'), (2, '2nd Line'), (2, '3rd Line'), (2, '4th Line')],
+    'D': [(2, '1st Pair'), (2, '2nd Pair'), (2, '3rd Pair')],
+    'G': [(1, 'Starter'), (1, 'Backup')],
+}
+
+
+# %%
+def load_teams(team_data):
+    return (
+        team_data
+        .filter(pl.col('disabled') == False)
+        .select('tid', pl.col('abbrev').alias('team'), )
+        .extend(pl.DataFrame({'tid': [-2, -1], 'team': ['Draft', 'FA']}))
+    )
+
+
+def line_slots():
+    """
+    League-wide depth chart as a lookup table. The player ranked p_rk at a position fills slot
+    (p_rk - 1) // n_teams, so each team-sized block of ranks maps to one row.
+
+    :return: DataFrame of pos, slot, line
+    """
+    rows = [
+        (pos, slot, label)
+        for pos, slots in LINE_SLOTS.items()
+        for slot, label in enumerate(label for count, label in slots for _ in range(count))
+    ]
+    return pl.DataFrame(rows, schema={'pos': pl.String, 'slot': pl.UInt32, 'line': pl.String}, orient='row')
+
+
+def players_query(player_data, team_data, settings):
+    """
+    Lazy query graph from raw players to the display-ready frame the pages read.
+
+    :param player_data: Raw players, see hgm.data.ingest.PLAYER_SCHEMA
+    :param team_data: Teams returned by load_teams
+    :param settings: Game settings of the league
+    :return: LazyFrame
+    """
+    n_teams = team_data.filter(pl.col('tid') >= 0).height
+    players_raw = player_data.lazy()
+    birth_places = (
+        players_raw
+        .select(pl.col('pid'), pl.col('born'))
+        .unnest('born')
+        .select(
+            pl.col('pid'),
+            pl.col('loc').str.split(', ').list[-1].alias('country')
+        )
+    )
+    progression = scan_progs()
+    return (
+        process_players(players_raw, progression, settings, quantile_data=scan_quantiles())
+        .join(birth_places, on='pid', how='left')
+        .join(team_data.lazy(), on='tid', how='left')
+        .with_columns(
+            is_current=pl.col('status') == 'current',
+            is_prospect=((pl.col('age') <= 21) & (pl.col('team') != 'Draft')).fill_null(False),
+        )
+        # Ordinal ranks break ties by row order, which the sort keeps deterministic
+        .sort('pid', 'season')
+        .with_columns(
+            p_rk=pl.col('ovr').rank(method='ordinal', descending=True).over(['season', 'pos']),
+            pr_rk=pl.when(pl.col('is_prospect')).then(
+                pl.col('sum_value').rank(method='ordinal', descending=True).over(['season', 'is_prospect'])),
+            pr_rk_pos=pl.when(pl.col('is_prospect')).then(
+                pl.col('sum_value').rank(method='ordinal', descending=True).over(['season', 'pos', 'is_prospect'])),
+        )
+        .with_columns(slot=(pl.col('p_rk') - 1) // n_teams)
+        .join(line_slots().lazy(), on=['pos', 'slot'], how='left', maintain_order='left')
+        .with_columns(pl.col('line').fill_null('Reserve'))
+        .select(
+            'player', 'pid', 'tid', 'season', 'draft_year', 'pos', 'age', 'status', 'ovr', 'pot', 'value', 'salary',
+            'surplus', 'cv_current', 'cv_next', 'cv_total', 'country', 'team', 'is_current', 'years', 'max_value',
+            'sum_value', 'p_rk', 'is_prospect', 'pr_rk', 'pr_rk_pos', 'line',
+            *percentile_columns('ovr'), *percentile_columns('value'), *percentile_columns('sum_value'),
+        )
+    )
+
+
+def load_players(player_data, team_data, settings):
+    # The graph is dominated by window expressions, which the in-memory engine runs faster
+    return players_query(player_data, team_data, settings).collect(engine='in-memory')
+
+
+def process_league(source):
+    """
+    Read a league export and run it through the player pipeline.
+
+    :param source: Path to a JSON file, raw bytes, or a file-like object
+    :return: Dict with 'game_settings', 'teams' and 'players'
+    """
+    league = read_league(source)
+    game_settings = league['game_settings']
+    teams = load_teams(league['teams'])
+    players = load_players(league['players'], teams, game_settings)
+    return {
+        'game_settings': game_settings,
+        'teams': teams,
+        'players': players
+    }
@@ -1,15 +1,13 @@
 # %%
 import polars as pl
-import pickle
 
-from hgm.config import MODELS_DIR
+from hgm.data.progression import PROGS_KEYS, percentile_columns
+from hgm.models import SALARY_FEATURES, cap_table, predict_salaries
 
-model_dict = {
-    position: pickle.load(open(MODELS_DIR / 'ovr_to_cap' / f'{position}.pkl', 'rb'))
-    for position in ['C', 'W', 'D', 'G']
-}
-
-salary_model = pickle.load(open(MODELS_DIR / 'salary' / 'xgboost_salary.pkl', 'rb'))
+# Seasons projected per player, starting with the current one
+PROJECTION_YEARS = 10
+# Seasons a projected next contract is assumed to run
+CONTRACT_YEARS = 5
 
 
 # %%
@@ -23,7 +21,7 @@ def map_positions(pos_column):
 
 
 # %%
-def load_players(player_data, progs_data, settings):
+def load_players(player_data, progs_data, settings, horizon=PROJECTION_YEARS, quantile_data=None):
     player_ratings = (
         player_data
         .select('pid', 'tid', 'firstName', 'lastName', 'born', 'ratings')
@@ -59,63 +57,52 @@ def load_players(player_data, progs_data, settings):
         .select('pid', pl.col('year').alias('draft_year'))
     )
 
-    ovr_progs = (
-        progs_data
-        .filter(pl.col('variable').str.contains('ovr'))
-        .select(
-            pl.col('pos'),
-            pl.col('age'),
-            pl.col('ovr'),
-            pl.col('variable').str.split('_').list.last().cast(pl.Int64).add(settings['season']).alias('season'),
-            pl.col('value').alias('ovr_pred')
-        )
-    )
-
-    value_progs = (
-        progs_data
-        .filter(pl.col('variable').str.contains('value'))
-        .select(
-            pl.col('pos'),
-            pl.col('age'),
-            pl.col('ovr'),
-            pl.col('variable').str.split('_').list.last().cast(pl.Int64).add(settings['season']).alias('season'),
-            pl.col('value').alias('value_pred')
-        )
-    )
-
-    def assign_cap_values(pos_column: pl.Expr, ovr_column: pl.Expr, clip_value: int) -> pl.Expr:
-        return (
-            pl.when(pos_column == 'C').then(
-                ovr_column * model_dict['C'].coef_[0] + model_dict['C'].intercept_[0])
-            .when(pos_column == 'W').then(
-                ovr_column * model_dict['W'].coef_[0] + model_dict['W'].intercept_[0])
-            .when(pos_column == 'D').then(
-                ovr_column * model_dict['D'].coef_[0] + model_dict['D'].intercept_[0])
-            .when(pos_column == 'G').then(
-                ovr_column * model_dict['G'].coef_[0] + model_dict['G'].intercept_[0])
-            .clip(clip_value)
+    # Key columns of the progression tables, cast to their compact dtypes; the current season
+    # is horizon 0, which has no progression
+    progs_keys = [
+        pl.col('pos').cast(PROGS_KEYS['pos']),
+        pl.col('age').cast(PROGS_KEYS['age']),
+        pl.col('ovr').cast(PROGS_KEYS['ovr']),
+        (pl.col('season') - settings['season']).cast(PROGS_KEYS['horizon']),
+    ]
+
+    # Expected values and, if given, percentiles share their keys, so the players join them once
+    projections = progs_data.select(*PROGS_KEYS, ovr_pred='exp_ovr', value_pred='exp_value')
+    percentiles = {}
+    if quantile_data is not None:
+        projections = projections.join(
+            quantile_data.select(*PROGS_KEYS, *percentile_columns('ovr'), *percentile_columns('value')),
+            on=list(PROGS_KEYS), how='left',
         )
+        # The current season is known, so every percentile of it is the current ovr and value
+        percentiles = {
+            column: pl.when(pl.col('season') == settings['season']).then(pl.col(current)).otherwise(pl.col(column))
+            for current, prefix in [('ovr', 'ovr'), ('cap_value', 'value')]
+            for column in percentile_columns(prefix)
+        }
 
     players = (
         player_ratings
         .with_columns(
-            pl.Series('season', [range(settings['season'], settings['season'] + 10)], dtype=pl.List)
+            season=pl.int_ranges(settings['season'], settings['season'] + horizon)
         )
         .explode('season')
         .join(player_salaries, on=['pid', 'season'], how='left')
         .join(player_draft_years, on='pid', how='left')
-        .join(ovr_progs, on=['pos', 'age', 'season', 'ovr'], how='left')
-        .join(value_progs, on=['pos', 'age', 'season', 'ovr'], how='left')
-        .with_columns(
-            cap_value=assign_cap_values(pl.col('pos'), pl.col('ovr'), 0)
-        )
+        .join(projections, left_on=progs_keys, right_on=list(PROGS_KEYS), how='left')
+        .join(cap_table().lazy(), on=['pos', 'ovr'], how='left')
+    )
+
+    players = (
+        players
         .select(
             'player', 'pid', 'tid', 'season', 'pos', 'draft_year',
             age=pl.col('age') + pl.col('season') - settings['season'],
             salary=pl.col('salary') / 1000,
             ovr=pl.when(pl.col('season') == settings['season']).then(pl.col('ovr')).otherwise(pl.col('ovr_pred')),
             cap_value=pl.when(pl.col('season') == settings['season']).then(pl.col('cap_value')).otherwise(
-                pl.col('value_pred'))
+                pl.col('value_pred')),
+            **percentiles,
         )
         .filter(pl.col('season') >= settings['season'])
     )
@@ -124,40 +111,46 @@ def load_players(player_data, progs_data, settings):
 
 
 # %%
-def add_placeholder_salaries(df, settings):
+def add_placeholder_salaries(df, settings, horizon=CONTRACT_YEARS):
     last_contracts = (
         df
         .filter(pl.col('salary').is_not_null())
         .group_by('pid').tail(1)
         .select('pid', 'season', map_positions(pl.col('pos')), 'age', 'ovr', 'salary')
         .with_columns(
-            season=pl.col('season').map_elements(lambda x: list(range(x + 1, x + 6)), return_dtype=pl.List(pl.Int64))
+            season=pl.int_ranges(pl.col('season') + 1, pl.col('season') + 1 + horizon)
         )
         .explode('season')
     )
 
-    last_contracts = (
-        last_contracts
-        .with_columns(on_last_contract=salary_model.predict(last_contracts.select(['pos', 'age', 'ovr', 'salary'])))
-        .with_columns(pl.col('on_last_contract').mul(1.25).clip(0, settings['maxContract'] / 1000))
-    )
-
     no_contracts = (
         df
         .filter(pl.col('salary').first().over('pid').is_null())
         .group_by('pid').head(1)
         .select('pid', 'season', map_positions(pl.col('pos')), 'age', 'ovr', 'salary')
         .with_columns(
-            season=pl.col('season').map_elements(lambda x: list(range(x, x + 5)), return_dtype=pl.List(pl.Int64))
+            season=pl.int_ranges(pl.col('season'), pl.col('season') + horizon)
         )
         .explode('season')
     )
 
-    no_contracts = (
-        no_contracts
-        .with_columns(on_no_contract=salary_model.predict(no_contracts.select(['pos', 'age', 'ovr', 'salary'])))
-        .with_columns(pl.col('on_no_contract').mul(1.25).clip(0, settings['maxContract'] / 1000))
+    # Both populations go through the model as one deduplicated batch in a single graph node
+    contracts = (
+        pl.concat([
+            last_contracts.with_columns(last_contract=pl.lit(True)),
+            no_contracts.with_columns(last_contract=pl.lit(False)),
+        ])
+        .with_columns(
+            prediction=pl.struct(SALARY_FEATURES).map_batches(
+                lambda features: predict_salaries(features.struct.unnest()),
+                return_dtype=pl.Float32,
+                is_elementwise=True,
+            )
+        )
+        .with_columns(pl.col('prediction').mul(1.25).clip(0, settings['maxContract'] / 1000))
     )
+    last_contracts = contracts.filter(pl.col('last_contract')).rename({'prediction': 'on_last_contract'})
+    no_contracts = contracts.filter(~pl.col('last_contract')).rename({'prediction': 'on_no_contract'})
 
     df = (
         df
@@ -181,31 +174,54 @@ def add_contract_value(cap_value, salary):
 
 
 # %%
-def load_and_process_players(player_data, prog_data, settings):
-    players = (
-        load_players(player_data, prog_data, settings)
-        .collect()
-        .pipe(add_placeholder_salaries, settings=settings)
-        .lazy()
+def process_players(player_data, prog_data, settings, horizon=PROJECTION_YEARS, contract_years=CONTRACT_YEARS,
+                    quantile_data=None):
+    """
+    Lazy query graph from raw players to projected seasons with values, salaries and surplus,
+    plus the per-player totals the pages rank and filter on.
+
+    :param player_data: LazyFrame of raw players, see hgm.data.ingest.PLAYER_SCHEMA
+    :param prog_data: LazyFrame of calculated progressions
+    :param quantile_data: Optional LazyFrame of progression percentiles, see
+        hgm.data.progression.calculate_quantiles. Adds the ovr_p*/value_p* bands of every
+        season and their per-player sums sum_value_p*.
+    :return: LazyFrame with one row per player and projected season
+    """
+    percentiles = []
+    if quantile_data is not None:
+        percentiles = percentile_columns('ovr') + percentile_columns('value') + percentile_columns('sum_value')
+    return (
+        load_players(player_data, prog_data, settings, horizon=horizon, quantile_data=quantile_data)
+        # add_placeholder_salaries relies on season order within each player and reads the
+        # projections three times; sort and compute them once
+        .sort('pid', 'season')
+        .cache()
+        .pipe(add_placeholder_salaries, settings=settings, horizon=contract_years)
         .with_columns(
-            pot=pl.col('ovr').max().over('pid'),
             cap_surplus=add_contract_value(pl.col('cap_value'), pl.col('salary')),
-            next_cap_surplus=add_contract_value(pl.col('cap_value'), pl.col('salary_next'))
-        )
-        .with_columns(
-            contract_value=pl.col('cap_surplus').sum().over('pid'),
-            next_contract_value=pl.col('next_cap_surplus').sum().over('pid')
-        )
-        .with_columns(
-            total_contract_value=pl.col('contract_value') + pl.col('next_contract_value').clip(0),
+            next_cap_surplus=add_contract_value(pl.col('cap_value'), pl.col('salary_next')),
             status=(
                 pl.when(pl.col('salary').is_not_null()).then(pl.lit('current'))
                 .when(pl.col('salary_next').is_not_null()).then(pl.lit('next'))
                 .otherwise(pl.lit('none'))
             ).cast(pl.Categorical)
         )
+        # Windows over the same key in one context share a single partitioning of the frame
+        .with_columns(
+            pot=pl.col('ovr').max().over('pid'),
+            contract_value=pl.col('cap_surplus').sum().over('pid'),
+            next_contract_value=pl.col('next_cap_surplus').sum().over('pid'),
+            years=(pl.col('status') == 'current').sum().over('pid'),
+            max_value=pl.col('cap_value').max().over('pid'),
+            sum_value=pl.col('cap_value').sum().over('pid'),
+            # Sums of the same percentile every season, i.e. a career that keeps to that band
+            **{
+                f'sum_{column}': pl.col(column).sum().over('pid')
+                for column in percentiles if column.startswith('value_')
+            },
+        )
         .select(
-            'player', 'pid', 'tid', 'season', 'draft_year', 'pos', 'age', 'status', 'ovr', 'pot',
+            'player', 'pid', 'tid', 'season', 'draft_year', 'pos', 'age', 'status', 'ovr', 'pot', *percentiles,
             value=pl.col('cap_value'),
             salary=(
                 pl.when(pl.col('status') == 'current').then(pl.col('salary'))
@@ -219,9 +235,18 @@ def load_and_process_players(player_data, prog_data, settings):
             ),
             cv_current=pl.col('contract_value'),
             cv_next=pl.col('next_contract_value'),
-            cv_total=pl.col('total_contract_value'),
+            cv_total=pl.col('contract_value') + pl.col('next_contract_value').clip(0),
+            years='years',
+            max_value='max_value',
+            sum_value='sum_value',
         )
-        .collect()
     )
-    return players
+
+
+def load_and_process_players(player_data, prog_data, settings, horizon=PROJECTION_YEARS,
+                             contract_years=CONTRACT_YEARS, quantile_data=None):
+    return process_players(
+        player_data.lazy(), prog_data.lazy(), settings, horizon=horizon, contract_years=contract_years,
+        quantile_data=quantile_data.lazy() if quantile_data is not None else None,
+    ).collect()
 # %%
@@ -0,0 +1,425 @@
+# %%
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import polars as pl
+
+from hgm.config import DATA_DIR
+from hgm.models import cap_coefficients
+
+PROGRESSION_PATH = DATA_DIR / 'constants' / 'progression.parquet'
+CALCULATED_PROGS_PATH = DATA_DIR / 'constants' / 'calculated_progs.parquet'
+PROGS_QUANTILES_PATH = DATA_DIR / 'constants' / 'progs_quantiles.parquet'
+# Partitioned, versioned build of both tables; CURRENT names the published version
+PROGS_DIR = DATA_DIR / 'constants' / 'progs'
+
+POSITIONS = ['C', 'W', 'D', 'G']
+# Ratings changes are fitted for these ages; older players reuse the last fitted age
+KDE_AGES = range(18, 36)
+# Ages a progression is projected from, and how many seasons ahead
+PROJECTED_AGES = range(18, 45)
+HORIZONS = 9
+# Grid of ovr changes the densities are evaluated on
+GRID = np.linspace(-100, 100, 1000)
+# Percentiles of the projected ovr and cap value stored per horizon
+PERCENTILES = [10, 25, 50, 75, 90]
+# The calculated tables are long on (pos, age, ovr, horizon), with compact key dtypes
+POSITION_DTYPE = pl.Enum(POSITIONS)
+PROGS_KEYS = {'pos': POSITION_DTYPE, 'age': pl.UInt8, 'ovr': pl.UInt8, 'horizon': pl.UInt8}
+# Bump when the layout of the calculated tables changes, so update_progs rebuilds them
+PROGS_LAYOUT = 2
+
+
+def percentile_columns(prefix):
+    """Names of the stored percentile columns, e.g. ovr_p10..ovr_p90."""
+    return [f'{prefix}_p{percentile}' for percentile in PERCENTILES]
+
+
+# %%
+def rating_changes(player_data):
+    """
+    Season-over-season ovr change of every player.
+
+    :param player_data: (Lazy)Frame of raw players with pid, born and ratings
+    :return: DataFrame of pid, season, pos, age, ovr_shift
+    """
+    return (
+        player_data.lazy()
+        .select('pid', 'born', 'ratings')
+        .explode('ratings')
+        .unnest('ratings')
+        .with_columns(
+            age=pl.col('season') - pl.col('born').struct.field('year')
+        )
+        .unique(['pid', 'season'])
+        .sort(['pid', 'season'])
+        .select('pid', 'season', 'age', 'pos', 'ovr')
+        .with_columns(
+            ovr_shift=pl.col('ovr').shift(-1).over('pid') - pl.col('ovr')
+        )
+        .select('pid', 'season', 'pos', 'age', 'ovr_shift')
+        .drop_nulls()
+        .collect()
+    )
+
+
+def season_correlation(changes):
+    """
+    Correlation of a player's development between consecutive seasons, for the Gaussian copula
+    of hgm.data.simulation. Each ovr change is ranked within the (pos, age) sample its KDE is
+    fitted to, and the rank correlation of consecutive seasons of the same pid is converted to
+    the correlation of the normal latent percentiles.
+
+    :param changes: DataFrame of pid, season, pos, age, ovr_shift, see rating_changes
+    :return: Latent correlation, 0 when there are fewer than two pairs of seasons
+    """
+    pairs = (
+        changes.lazy()
+        .filter(pl.col('age').is_in(KDE_AGES))
+        .with_columns(
+            percentile=(pl.col('ovr_shift').rank() - 0.5).over('pos', 'age') / pl.len().over('pos', 'age')
+        )
+        .with_columns(
+            next_season=pl.col('season').shift(-1).over('pid', order_by='season'),
+            next_percentile=pl.col('percentile').shift(-1).over('pid', order_by='season'),
+        )
+        .filter(pl.col('next_season') == pl.col('season') + 1)
+        .select(spearman=pl.corr('percentile', 'next_percentile'), pairs=pl.len())
+        .collect()
+    )
+    if pairs['pairs'].item() < 2 or pairs['spearman'].is_nan().item() or pairs['spearman'].is_null().item():
+        return 0.0
+    # Pearson correlation of bivariate normals with the measured rank correlation
+    return float(2 * np.sin(np.pi * pairs['spearman'].item() / 6))
+
+
+def kde_densities(samples):
+    """
+    Evaluate the KDE of each age's ovr changes on GRID, once per age.
+
+    :param samples: Dict of age -> array of ovr changes for one position
+    :return: Dict of age -> density on GRID, for every age a projection can reach
+    """
+    # scipy is imported where used so the app can scan the tables without loading it
+    from scipy.stats import gaussian_kde
+
+    densities = {age: gaussian_kde(samples[age])(GRID) for age in KDE_AGES}
+    for age in range(KDE_AGES.stop, PROJECTED_AGES.stop + HORIZONS):
+        densities[age] = densities[KDE_AGES.stop - 1]
+    return densities
+
+
+def convolve_horizons(densities, age, horizons=HORIZONS):
+    """
+    Distribution of the total ovr change over 1..horizons seasons starting at age. Each horizon
+    extends the previous one by a single FFT convolution with the next age's density.
+
+    :return: List of densities on GRID, one per horizon
+    """
+    from scipy import signal
+
+    y_convolved = densities[age]
+    progressions = [y_convolved]
+    for years_in_adv in range(1, horizons):
+        y_convolved = signal.fftconvolve(y_convolved, densities[age + years_in_adv], mode='same')
+        # Normalize so the density integrates to one over the grid
+        y_convolved = y_convolved / np.trapezoid(y_convolved, GRID)
+        progressions.append(y_convolved)
+    return progressions
+
+
+def position_progression(position, samples):
+    """Progression frame of one position, with the same layout as progression.parquet."""
+    densities = kde_densities(samples)
+    return pl.concat([
+        pl.DataFrame({
+            'x': GRID,
+            **{f'y_{years_in_adv + 1}': y for years_in_adv, y in enumerate(convolve_horizons(densities, age))},
+            'position': position,
+            'age': age,
+        })
+        for age in PROJECTED_AGES
+    ])
+
+
+def build_progression(changes, max_workers=None):
+    """
+    Build the progression table from season-over-season ovr changes, one position per process.
+
+    :param changes: DataFrame of pos, age, ovr_shift, see rating_changes
+    :param max_workers: Size of the process pool; defaults to one process per position, capped
+        at the number of CPUs. With a single worker everything runs in this process.
+    :return: DataFrame of x, y_1..y_9, position, age
+    """
+    samples = {
+        position: {
+            age: changes.filter((pl.col('pos') == position) & (pl.col('age') == age))['ovr_shift'].to_numpy()
+            for age in KDE_AGES
+        }
+        for position in POSITIONS
+    }
+    max_workers = max_workers or min(len(POSITIONS), os.cpu_count() or 1)
+    if max_workers == 1:
+        return pl.concat([position_progression(position, samples[position]) for position in POSITIONS])
+
+    # Forking a process that already runs Polars' thread pool can deadlock; start fresh interpreters
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        frames = executor.map(position_progression, POSITIONS, [samples[position] for position in POSITIONS])
+        return pl.concat(list(frames))
+
+
+# %%
+def calculate_progs(progression, coefficients):
+    """
+    Expected ovr and cap value after 1..9 seasons for every (pos, age, ovr 0-100).
+
+    For a starting ovr the expected ovr is ovr + E[x], and the expected value is the density
+    weighted sum of clip(coef * (ovr + x) + intercept, 0). Over all starting ovrs that is a
+    (101 x grid) value matrix times the (grid x horizons) density matrix of each (pos, age),
+    so nothing is exploded against the ovr range.
+
+    :param progression: DataFrame of x, y_1..y_9, position, age, see build_progression
+    :param coefficients: Per-position cap value models, see hgm.models.cap_coefficients
+    :return: DataFrame of PROGS_KEYS, exp_ovr, exp_value
+    """
+    y_columns = [f'y_{i}' for i in range(1, HORIZONS + 1)]
+    ovr = np.arange(0, 101)
+    frames = []
+    for (position, age), partition in progression.partition_by(['position', 'age'], as_dict=True).items():
+        x = partition['x'].to_numpy()
+        densities = partition.select(y_columns).to_numpy()
+        mass = densities.sum(axis=0)
+        model = coefficients[position]
+        values = np.clip((ovr[:, None] + x[None, :]) * model['coef'] + model['intercept'], 0, None)
+        # (ovr, horizon) matrices, flattened to one row per (ovr, horizon)
+        frames.append(pl.DataFrame({
+            'pos': position,
+            'age': age,
+            'ovr': np.repeat(ovr, HORIZONS),
+            'horizon': np.tile(np.arange(1, HORIZONS + 1), len(ovr)),
+            'exp_ovr': (ovr[:, None] + x @ densities / mass).ravel(),
+            'exp_value': (values @ densities / mass).ravel(),
+        }))
+    return pl.concat(frames).cast(PROGS_KEYS).sort(list(PROGS_KEYS))
+
+
+def calculate_quantiles(progression, coefficients):
+    """
+    Percentiles of ovr and cap value after 1..9 seasons for every (pos, age, ovr 0-100).
+
+    The ovr after h seasons is the starting ovr plus the total change, so its percentiles are
+    the starting ovr shifted by the percentiles of the horizon-h density. The cap value is a
+    non-decreasing function of ovr, so its percentiles are the values of the ovr percentiles.
+
+    :param progression: DataFrame of x, y_1..y_9, position, age, see build_progression
+    :param coefficients: Per-position cap value models, see hgm.models.cap_coefficients
+    :return: DataFrame of PROGS_KEYS, ovr_p10..ovr_p90, value_p10..value_p90
+    """
+    y_columns = [f'y_{i}' for i in range(1, HORIZONS + 1)]
+    ovr = np.arange(0, 101)
+    frames = []
+    for (position, age), partition in progression.partition_by(['position', 'age'], as_dict=True).items():
+        x = partition['x'].to_numpy()
+        densities = partition.select(y_columns).to_numpy()
+        # Centre each grid point's mass on the point itself
+        cdf = np.cumsum(densities, axis=0) - densities / 2
+        cdf /= cdf[-1]
+        growth = np.array([np.interp(np.array(PERCENTILES) / 100, cdf[:, i], x) for i in range(HORIZONS)])
+        # (ovr, horizon, percentile), flattened to one row per (ovr, horizon)
+        ovr_percentiles = (ovr[:, None, None] + growth[None]).reshape(-1, len(PERCENTILES))
+        model = coefficients[position]
+        value_percentiles = np.clip(ovr_percentiles * model['coef'] + model['intercept'], 0, None)
+        frames.append(pl.DataFrame({
+            'pos': position,
+            'age': age,
+            'ovr': np.repeat(ovr, HORIZONS),
+            'horizon': np.tile(np.arange(1, HORIZONS + 1), len(ovr)),
+            **dict(zip(percentile_columns('ovr'), ovr_percentiles.T)),
+            **dict(zip(percentile_columns('value'), value_percentiles.T)),
+        }))
+    return pl.concat(frames).cast(PROGS_KEYS).sort(list(PROGS_KEYS))
+
+
+# %%
+def _fingerprint(samples):
+    return hashlib.sha256(np.sort(np.asarray(samples, dtype=np.float64)).tobytes()).hexdigest()
+
+
+def _current_version():
+    try:
+        return PROGS_DIR / (PROGS_DIR / 'CURRENT').read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _current_tables():
+    # Versions whose calculated tables predate PROGS_LAYOUT are only read for their densities
+    current = _current_version()
+    if current is None or json.loads((current / 'manifest.json').read_text()).get('layout') != PROGS_LAYOUT:
+        return None
+    return current
+
+
+def scan_progs():
+    """
+    LazyFrame over the calculated progressions the pipeline joins against: the partitioned
+    dataset CURRENT points at, or the shipped calculated_progs.parquet if none was built yet.
+    Tables are only ever built by update_progs (hgm progs).
+    """
+    current = _current_tables()
+    if current is None:
+        return pl.scan_parquet(CALCULATED_PROGS_PATH)
+    return pl.scan_parquet(current / 'calculated' / '*.parquet')
+
+
+def scan_quantiles():
+    """LazyFrame over the progression percentiles, partitioned like scan_progs."""
+    current = _current_tables()
+    if current is None:
+        return pl.scan_parquet(PROGS_QUANTILES_PATH)
+    return pl.scan_parquet(current / 'quantiles' / '*.parquet')
+
+
+def scan_progression():
+    """LazyFrame over the progression densities, partitioned like scan_progs."""
+    current = _current_version()
+    if current is None:
+        return pl.scan_parquet(PROGRESSION_PATH)
+    return pl.scan_parquet(current / 'progression' / '*.parquet')
+
+
+def read_season_correlation():
+    """
+    Season correlation of the published version, see season_correlation. The shipped tables carry
+    no rating history to measure it on, so without a built version seasons are independent (0).
+    """
+    current = _current_version()
+    if current is None:
+        return 0.0
+    return json.loads((current / 'manifest.json').read_text()).get('season_correlation', 0.0)
+
+
+def _stale_ages(changed):
+    """Projected ages whose horizons read the density of any age in changed."""
+    return [
+        age for age in PROJECTED_AGES
+        if any(min(prior, KDE_AGES.stop - 1) in changed for prior in range(age, age + HORIZONS))
+    ]
+
+
+def update_progs(player_data, positions=None, ages=None):
+    """
+    Incrementally rebuild the partitioned progression dataset.
+
+    Every (pos, age) rating-change sample is fingerprinted. Only densities whose sample
+    changed are re-fitted, and only the projected ages whose horizons read one of them
+    (ages a-8..a of a changed age a) are re-convolved and re-aggregated. All other
+    partitions are hard-linked from the current version. The new version is published by
+    atomically replacing the CURRENT pointer, so readers never see a half-written dataset.
+    The previous version is kept for readers still scanning it; older ones are removed.
+    The manifest also records the season correlation of the whole history, see season_correlation.
+
+    :param player_data: (Lazy)Frame of raw players with pid, born and ratings
+    :param positions: Only refresh these positions, e.g. ['G']; defaults to all
+    :param ages: Only refresh the densities of these ages, e.g. range(18, 23); defaults to all
+    :return: Dict of position -> list of rebuilt projected ages
+    """
+    from scipy.stats import gaussian_kde
+
+    changes = rating_changes(player_data)
+    correlation = season_correlation(changes)
+    coefficients = cap_coefficients()
+    current = _current_version()
+    manifest = json.loads((current / 'manifest.json').read_text()) if current else {'densities': {}, 'cap_models': None}
+    cap_changed = manifest['cap_models'] != _fingerprint([value for model in coefficients.values() for value in model.values()])
+    # Versions built with another table layout are re-aggregated from their stored densities
+    reaggregate = cap_changed or (current is not None and manifest.get('layout') != PROGS_LAYOUT)
+
+    version = PROGS_DIR / f'{time.strftime("%Y%m%dT%H%M%S")}-{uuid.uuid4().hex[:8]}'
+    for kind in ['densities', 'progression', 'calculated', 'quantiles']:
+        (version / kind).mkdir(parents=True)
+
+    def reuse(kind, position, age):
+        source, target = current / kind / f'{position}_{age}.parquet', version / kind / f'{position}_{age}.parquet'
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    rebuilt, fingerprints = {}, {}
+    for position in POSITIONS:
+        fingerprints[position] = dict(manifest['densities'].get(position, {}))
+        refreshable = current is None or positions is None or position in positions
+        changed = set()
+        for age in KDE_AGES:
+            fingerprint = _fingerprint(
+                changes.filter((pl.col('pos') == position) & (pl.col('age') == age))['ovr_shift'].to_numpy()
+            )
+            if (refreshable and (ages is None or age in ages) or current is None) and (
+                    fingerprints[position].get(str(age)) != fingerprint):
+                changed.add(age)
+                fingerprints[position][str(age)] = fingerprint
+
+        densities = {}
+        for age in KDE_AGES:
+            if age in changed:
+                samples = changes.filter((pl.col('pos') == position) & (pl.col('age') == age))['ovr_shift'].to_numpy()
+                densities[age] = gaussian_kde(samples)(GRID)
+                pl.DataFrame({'y': densities[age]}).write_parquet(version / 'densities' / f'{position}_{age}.parquet')
+            else:
+                reuse('densities', position, age)
+
+        stale = _stale_ages(changed)
+        needed = {min(prior, KDE_AGES.stop - 1) for start in stale for prior in range(start, start + HORIZONS)}
+        for age in needed - densities.keys():
+            densities[age] = pl.read_parquet(version / 'densities' / f'{position}_{age}.parquet')['y'].to_numpy()
+        for age in range(KDE_AGES.stop, PROJECTED_AGES.stop + HORIZONS):
+            densities[age] = densities.get(KDE_AGES.stop - 1)
+
+        for age in PROJECTED_AGES:
+            if age in stale:
+                progression = pl.DataFrame({
+                    'x': GRID,
+                    **{f'y_{years_in_adv + 1}': y for years_in_adv, y in enumerate(convolve_horizons(densities, age))},
+                    'position': position,
+                    'age': age,
+                })
+                progression.write_parquet(version / 'progression' / f'{position}_{age}.parquet')
+            else:
+                reuse('progression', position, age)
+                if not reaggregate:
+                    reuse('calculated', position, age)
+                    reuse('quantiles', position, age)
+                    continue
+                progression = pl.read_parquet(version / 'progression' / f'{position}_{age}.parquet')
+            calculate_progs(progression, coefficients).write_parquet(version / 'calculated' / f'{position}_{age}.parquet')
+            calculate_quantiles(progression, coefficients).write_parquet(version / 'quantiles' / f'{position}_{age}.parquet')
+        rebuilt[position] = stale
+
+    if current is not None and not reaggregate and not any(rebuilt.values()) and (
+            manifest.get('season_correlation') == correlation):
+        shutil.rmtree(version)
+        return rebuilt
+
+    (version / 'manifest.json').write_text(json.dumps({
+        'layout': PROGS_LAYOUT,
+        'densities': fingerprints,
+        'cap_models': _fingerprint([value for model in coefficients.values() for value in model.values()]),
+        'season_correlation': correlation,
+    }, indent=2))
+    pointer = PROGS_DIR / f'.CURRENT-{uuid.uuid4().hex}'
+    pointer.write_text(version.name)
+    os.replace(pointer, PROGS_DIR / 'CURRENT')
+
+    for path in PROGS_DIR.iterdir():
+        if path.is_dir() and path not in (version, current):
+            shutil.rmtree(path, ignore_errors=True)
+    return rebuilt
@@ -0,0 +1,214 @@
+# %%
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+import numpy as np
+import polars as pl
+
+from hgm.data.progression import POSITIONS, PROJECTED_AGES, read_season_correlation, scan_progression
+from hgm.models import cap_coefficients
+
+# Resolution of the inverse CDFs the season changes are drawn from
+QUANTILE_POINTS = 1001
+# Simulations per batch, bounding the (simulations x players x seasons) arrays held at once
+CHUNK_SIZE = 500
+SUMMARY_PERCENTILES = [5, 25, 50, 75, 95]
+
+
+# %%
+def change_quantiles(progression):
+    """
+    Inverse CDF of the one-season ovr change of every (pos, age), tabulated at QUANTILE_POINTS
+    evenly spaced probabilities.
+
+    :param progression: DataFrame of x, y_1..y_9, position, age, see build_progression
+    :return: Array of shape (positions, ages, QUANTILE_POINTS), indexed by POSITIONS.index(pos)
+        and age - PROJECTED_AGES.start
+    """
+    probabilities = np.linspace(0, 1, QUANTILE_POINTS)
+    table = np.empty((len(POSITIONS), len(PROJECTED_AGES), QUANTILE_POINTS))
+    for (position, age), partition in progression.partition_by(['position', 'age'], as_dict=True).items():
+        density = partition['y_1'].to_numpy()
+        # Centre each grid point's mass on the point itself
+        cdf = np.cumsum(density) - density / 2
+        table[POSITIONS.index(position), age - PROJECTED_AGES.start] = np.interp(
+            probabilities, cdf / cdf[-1], partition['x'].to_numpy()
+        )
+    return table
+
+
+def roster_arrays(players):
+    """
+    Rostered players of a processed league as arrays, one row per player.
+
+    :param players: Processed players, see hgm.data.league.load_players
+    :return: Dict of pid, team, team_index, teams, position, age, ovr (current season) and
+        salary, a (players x seasons) array with NaN for seasons without a contract
+    """
+    seasons = players['season'].n_unique()
+    rostered = players.filter(pl.col('tid') >= 0).sort('pid', 'season')
+    current = rostered.filter(pl.col('season') == pl.col('season').min())
+    teams = current['team'].unique().sort()
+    return {
+        'pid': current['pid'].to_numpy(),
+        'team': current['team'].to_numpy(),
+        'teams': teams.to_numpy(),
+        'team_index': current['team'].replace_strict(teams, range(len(teams)), return_dtype=pl.Int64).to_numpy(),
+        'position': current['pos'].replace_strict(POSITIONS, range(len(POSITIONS)), return_dtype=pl.Int64).to_numpy(),
+        'age': current['age'].to_numpy(),
+        'ovr': current['ovr'].cast(pl.Float64).to_numpy(),
+        'salary': rostered['salary'].cast(pl.Float64).fill_null(np.nan).to_numpy().reshape(-1, seasons),
+    }
+
+
+def simulate_ovr(rng, table, position, age, ovr, n_simulations, seasons, correlation=0.0):
+    """
+    Draw ovr paths for every player. Each season's change is read off the inverse CDF of the
+    player's age through a Gaussian copula whose latent percentile follows an AR(1) process, so a
+    player who outgrows their age in one season tends to keep doing so. Every season's change keeps
+    its fitted distribution. Ages outside the fitted range use the nearest fitted age.
+
+    :param rng: numpy Generator
+    :param table: Inverse CDFs, see change_quantiles
+    :param position: Position index of each player
+    :param age: Current age of each player
+    :param ovr: Current ovr of each player
+    :param correlation: Correlation of consecutive latent percentiles; 0 draws every season
+        independently
+    :return: Array of shape (n_simulations, players, seasons); season 0 is the current ovr
+    """
+    from scipy.special import ndtr
+
+    flat = table.ravel()
+    paths = np.empty((n_simulations, len(ovr), seasons))
+    paths[..., 0] = ovr
+    latent = rng.standard_normal((n_simulations, len(ovr)))
+    for season in range(1, seasons):
+        if season > 1:
+            latent = correlation * latent + np.sqrt(1 - correlation ** 2) * rng.standard_normal(latent.shape)
+        point = ndtr(latent) * (QUANTILE_POINTS - 1)
+        lower = np.minimum(point.astype(np.int64), QUANTILE_POINTS - 2)
+        ages = np.clip(age + season - 1 - PROJECTED_AGES.start, 0, len(PROJECTED_AGES) - 1)
+        # Offset of each player's inverse CDF in the flattened table, plus the drawn cell
+        index = (position * len(PROJECTED_AGES) + ages) * QUANTILE_POINTS + lower
+        below, above = flat[index], flat[index + 1]
+        paths[..., season] = paths[..., season - 1] + below + (point - lower) * (above - below)
+    return paths
+
+
+def _simulate_chunk(seed, n_simulations, arrays, table, coefficients, correlation):
+    rng = np.random.default_rng(seed)
+    seasons = arrays['salary'].shape[1]
+    paths = simulate_ovr(
+        rng, table, arrays['position'], arrays['age'], arrays['ovr'], n_simulations, seasons, correlation
+    )
+    coef = np.array([coefficients[position]['coef'] for position in POSITIONS])[arrays['position']]
+    intercept = np.array([coefficients[position]['intercept'] for position in POSITIONS])[arrays['position']]
+    values = np.clip(paths * coef[:, None] + intercept[:, None], 0, None)
+    surplus = np.where(np.isnan(arrays['salary']), 0, values - arrays['salary']).sum(axis=-1)
+
+    # (simulations x players) @ (players x teams) one-hot sums every roster at once
+    membership = np.zeros((len(arrays['team_index']), len(arrays['teams'])))
+    membership[np.arange(len(arrays['team_index'])), arrays['team_index']] = 1
+    return values.sum(axis=-1) @ membership, surplus @ membership
+
+
+def iter_team_simulations(players, n_simulations, seed=0, chunk_size=CHUNK_SIZE, max_workers=1,
+                          correlation=None, progression=None):
+    """
+    Simulate team value and contract surplus in chunks of chunk_size careers per player, so memory
+    stays bounded by one chunk per worker however many simulations are run.
+
+    Each chunk draws from its own child of np.random.SeedSequence(seed), so the results are
+    reproducible for a given (seed, chunk_size) whatever the number of workers. Salaries are the
+    league's current and projected contracts and do not react to the simulated ovr.
+
+    The per-season changes follow the same densities sum_value is projected from, but a positive
+    correlation widens the spread of the cumulative change beyond their convolution, which assumes
+    independent seasons. Values are clipped at 0, so the simulated means can then sit above the
+    summed sum_value of a roster; with correlation 0 they agree up to Monte Carlo error.
+
+    :param players: Processed players, see hgm.data.league.load_players
+    :param n_simulations: Number of simulated careers per player
+    :param max_workers: Size of the process pool; with a single worker everything runs in this process
+    :param correlation: Correlation of a player's development percentile between consecutive
+        seasons; defaults to the one measured on the published rating history, see
+        hgm.data.progression.season_correlation
+    :param progression: Progression densities; defaults to the published ones
+    :return: Iterator of DataFrames of simulation, team, value, surplus, one per chunk
+    """
+    if progression is None:
+        progression = scan_progression().collect()
+    if correlation is None:
+        correlation = read_season_correlation()
+    arrays = roster_arrays(players)
+    table = change_quantiles(progression)
+    coefficients = cap_coefficients()
+    sizes = [min(chunk_size, n_simulations - start) for start in range(0, n_simulations, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    def frames(results):
+        start = 0
+        for size, (value, surplus) in zip(sizes, results):
+            yield pl.DataFrame({
+                'simulation': np.repeat(np.arange(start, start + size), len(arrays['teams'])),
+                'team': np.tile(arrays['teams'], size),
+                'value': value.ravel(),
+                'surplus': surplus.ravel(),
+            })
+            start += size
+
+    if max_workers == 1:
+        yield from frames(
+            _simulate_chunk(child, size, arrays, table, coefficients, correlation) for child, size in zip(seeds, sizes)
+        )
+        return
+
+    # Forking a process that already runs Polars' thread pool can deadlock; start fresh interpreters
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=context) as executor:
+        n = len(sizes)
+        yield from frames(executor.map(
+            _simulate_chunk, seeds, sizes, [arrays] * n, [table] * n, [coefficients] * n, [correlation] * n
+        ))
+
+
+def summarize_simulations(simulations):
+    """
+    Distribution of every team's simulated value and contract surplus.
+
+    :param simulations: DataFrame of simulation, team, value, surplus, see iter_team_simulations
+    :return: DataFrame of team and the mean, std and SUMMARY_PERCENTILES of value and surplus
+    """
+    return (
+        simulations
+        .group_by('team')
+        .agg(
+            *[
+                expr
+                for column in ['value', 'surplus']
+                for expr in [
+                    pl.col(column).mean().alias(f'{column}_mean'),
+                    pl.col(column).std().alias(f'{column}_std'),
+                    *[pl.col(column).quantile(percentile / 100).alias(f'{column}_p{percentile}')
+                      for percentile in SUMMARY_PERCENTILES],
+                ]
+            ]
+        )
+        .sort('value_mean', descending=True)
+    )
+
+
+def simulate_league(players, n_simulations=1000, seed=0, chunk_size=CHUNK_SIZE, max_workers=1,
+                    correlation=None, progression=None):
+    """
+    Monte Carlo distribution of every team's total value and contract surplus over the projected
+    seasons, see iter_team_simulations.
+
+    :return: DataFrame, see summarize_simulations
+    """
+    return summarize_simulations(pl.concat(iter_team_simulations(
+        players, n_simulations, seed=seed, chunk_size=chunk_size, max_workers=max_workers,
+        correlation=correlation, progression=progression,
+    )))
@@ -0,0 +1,76 @@
+# %%
+from collections import OrderedDict
+import threading
+from types import MappingProxyType
+
+from hgm.data.index import PlayerIndex
+
+
+# %%
+def freeze(league):
+    """
+    Make a processed league safe to share between sessions. Polars frames are already immutable
+    Arrow buffers; rechunking makes each column a single contiguous buffer. 'index' is a
+    PlayerIndex of the players for season and pid lookups.
+    """
+    players = league['players'].rechunk()
+    return MappingProxyType({
+        'game_settings': MappingProxyType(dict(league['game_settings'])),
+        'teams': league['teams'].rechunk(),
+        'players': players,
+        'index': PlayerIndex(players),
+    })
+
+
+class LeagueStore:
+    """
+    Process-wide registry of processed leagues, keyed by league hash. Every session viewing the
+    same league gets a reference to the same frames instead of its own copy.
+    """
+
+    def __init__(self, max_leagues=8):
+        self.max_leagues = max_leagues
+        self._leagues = OrderedDict()
+        self._names = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._leagues
+
+    def names(self):
+        """Dict of key -> display name of every league currently held, most recently used first."""
+        with self._lock:
+            return {key: self._names[key] for key in reversed(self._leagues)}
+
+    def get(self, key, load=None, name=None):
+        """
+        Return the league for key, calling load() on a miss. Concurrent sessions asking for the
+        same league wait for a single load instead of each processing it.
+
+        :param key: League hash, see hgm.data.cache.league_key
+        :param load: Function returning the processed league dict; None to only look up
+        :param name: Display name for the league, e.g. the uploaded file name
+        :return: Read-only league mapping, or None if missing and no loader was given
+        """
+        with self._lock:
+            if key in self._leagues:
+                self._leagues.move_to_end(key)
+                return self._leagues[key]
+            if load is None:
+                return None
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._leagues:
+                    return self._leagues[key]
+            league = freeze(load())
+            with self._lock:
+                self._leagues[key] = league
+                self._names[key] = name or key[:8]
+                self._loading.pop(key, None)
+                while len(self._leagues) > self.max_leagues:
+                    evicted, _ = self._leagues.popitem(last=False)
+                    self._names.pop(evicted, None)
+            return league
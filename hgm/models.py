@@ -0,0 +1,242 @@
+# %%
+from functools import cache
+import hashlib
+import json
+import pickle
+import threading
+
+import numpy as np
+import polars as pl
+
+from hgm.config import COMPILED_MODELS, MODELS_DIR
+
+POSITIONS = ['C', 'W', 'D', 'G']
+
+CAP_MODELS_DIR = MODELS_DIR / 'ovr_to_cap'
+CAP_COEFFICIENTS_PATH = CAP_MODELS_DIR / 'coefficients.json'
+CAP_TABLE_PATH = CAP_MODELS_DIR / 'cap_table.parquet'
+SALARY_MODEL_PATH = MODELS_DIR / 'salary' / 'xgboost_salary.pkl'
+SALARY_TABLE_PATH = MODELS_DIR / 'salary' / 'salary_table.parquet'
+SALARY_SPLITS_PATH = MODELS_DIR / 'salary' / 'salary_table.json'
+# Feature order the salary model was trained with (pos as 1-4, age, ovr, current salary in $M)
+SALARY_FEATURES = ['pos', 'age', 'ovr', 'salary']
+SALARY_MEMO_SIZE = 250_000
+
+# LRU memo of salary predictions: feature tuple -> prediction, with a last-used tick. Features are
+# held as the float32 values the model compares, so equal keys always mean equal predictions.
+_salary_memo = pl.DataFrame(schema={
+    **{feature: pl.Float32 for feature in SALARY_FEATURES}, 'prediction': pl.Float32, 'used': pl.UInt64,
+})
+_salary_memo_tick = 0
+_salary_memo_lock = threading.Lock()
+
+
+# %%
+def _unpickle(path):
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+def export_cap_coefficients():
+    """
+    Write the slope and intercept of each per-position ovr -> cap value LinearRegression to a
+    JSON sidecar so the app never has to import sklearn. Re-run after retraining the models.
+    """
+    coefficients = {}
+    for position in POSITIONS:
+        model = _unpickle(CAP_MODELS_DIR / f'{position}.pkl')
+        coefficients[position] = {
+            'coef': float(model.coef_.ravel()[0]),
+            'intercept': float(model.intercept_.ravel()[0]),
+        }
+    CAP_COEFFICIENTS_PATH.write_text(json.dumps(coefficients, indent=2))
+    return coefficients
+
+
+@cache
+def cap_coefficients():
+    """
+    Per-position (coef, intercept) of the ovr -> cap value models, loaded once per process.
+
+    :return: Dict of position -> {'coef': float, 'intercept': float}
+    """
+    if not CAP_COEFFICIENTS_PATH.exists():
+        return export_cap_coefficients()
+    return json.loads(CAP_COEFFICIENTS_PATH.read_text())
+
+
+@cache
+def salary_model():
+    """XGBoost next-contract salary model, unpickled on first use and kept for the process."""
+    return _unpickle(SALARY_MODEL_PATH)
+
+
+def _salary_iteration_range(model):
+    # Match XGBRegressor.predict, which stops at the early-stopping best iteration
+    best_iteration = getattr(model, 'best_iteration', None)
+    return (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+
+
+# %%
+def _cap_table():
+    coefficients = cap_coefficients()
+    return (
+        pl.DataFrame({'pos': POSITIONS})
+        .join(pl.DataFrame({'ovr': range(0, 101)}), how='cross')
+        .with_columns(
+            cap_value=(
+                pl.col('ovr')
+                * pl.col('pos').replace_strict({pos: model['coef'] for pos, model in coefficients.items()})
+                + pl.col('pos').replace_strict({pos: model['intercept'] for pos, model in coefficients.items()})
+            ).clip(0)
+        )
+    )
+
+
+def compile_cap_table():
+    """
+    Evaluate the ovr -> cap value models for every position and integer ovr (0-100) and store
+    the result next to the pickles, tagged with the hash of the coefficients it was built from.
+    Re-run after retraining the models.
+    """
+    cap_coefficients()
+    table = _cap_table()
+    table.write_parquet(CAP_TABLE_PATH, metadata={'coefficients_sha256': _sha256(CAP_COEFFICIENTS_PATH)})
+    return table
+
+
+@cache
+def cap_table():
+    """
+    Cap value of every (pos, ovr) pair, so the pipeline evaluates the models with a join.
+    Compiled on first use if missing or built from other coefficients.
+
+    :return: DataFrame of pos, ovr, cap_value
+    """
+    if not COMPILED_MODELS:
+        return _cap_table()
+    # Exports the coefficients if they never were
+    cap_coefficients()
+    if CAP_TABLE_PATH.exists() and (
+            pl.read_parquet_metadata(CAP_TABLE_PATH).get('coefficients_sha256') == _sha256(CAP_COEFFICIENTS_PATH)):
+        return pl.read_parquet(CAP_TABLE_PATH)
+    return compile_cap_table()
+
+
+def _sha256(path):
+    with open(path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def compile_salary_table():
+    """
+    Tabulate the XGBoost salary model exactly. Tree predictions are piecewise constant between
+    the split thresholds of each feature, so evaluating one point per cell of the threshold grid
+    (plus a missing-value cell per feature) reproduces every prediction the model can make.
+    Stored as Parquet next to the pickle with the thresholds and model hash in a JSON sidecar.
+    """
+    model = salary_model()
+    booster = model.get_booster()
+    last_tree = _salary_iteration_range(model)[1] - 1
+    trees = booster.trees_to_dataframe()
+    if last_tree >= 0:
+        trees = trees[trees['Tree'] <= last_tree]
+
+    splits, cells = {}, []
+    for i, feature in enumerate(SALARY_FEATURES):
+        feature_name = booster.feature_names[i] if booster.feature_names else f'f{i}'
+        thresholds = np.unique(trees.loc[trees['Feature'] == feature_name, 'Split'].to_numpy(np.float32))
+        splits[feature] = thresholds.tolist()
+        # One value per bin: below the first threshold, each threshold, then missing
+        cells.append(np.concatenate([thresholds[:1] - 1 if len(thresholds) else [0], thresholds, [np.nan]]))
+
+    grid = np.stack([axis.ravel() for axis in np.meshgrid(*cells, indexing='ij')], axis=1).astype(np.float32)
+    predictions = booster.inplace_predict(grid, iteration_range=_salary_iteration_range(model))
+    pl.DataFrame({'prediction': predictions}).write_parquet(SALARY_TABLE_PATH)
+    SALARY_SPLITS_PATH.write_text(json.dumps({
+        'model_sha256': _sha256(SALARY_MODEL_PATH),
+        'features': SALARY_FEATURES,
+        'splits': splits,
+    }, indent=2))
+
+
+@cache
+def salary_table():
+    """
+    Compiled salary model for the current pickle, compiled on first use if missing or stale.
+
+    :return: (dict of feature -> float32 thresholds, float32 predictions in C order), or None
+        when compiled models are disabled
+    """
+    if not COMPILED_MODELS:
+        return None
+    if not SALARY_SPLITS_PATH.exists() or (
+            json.loads(SALARY_SPLITS_PATH.read_text())['model_sha256'] != _sha256(SALARY_MODEL_PATH)):
+        compile_salary_table()
+    splits = json.loads(SALARY_SPLITS_PATH.read_text())['splits']
+    return (
+        {feature: np.array(thresholds, dtype=np.float32) for feature, thresholds in splits.items()},
+        pl.read_parquet(SALARY_TABLE_PATH)['prediction'].to_numpy(),
+    )
+
+
+def compile_models():
+    """Rebuild every lookup table after retraining or re-exporting the models."""
+    compile_cap_table()
+    compile_salary_table()
+
+
+def _predict_salary_rows(features):
+    table = salary_table()
+    if table is None:
+        model = salary_model()
+        return model.get_booster().inplace_predict(
+            np.ascontiguousarray(features.select(pl.col(SALARY_FEATURES).cast(pl.Float32)).to_numpy()),
+            iteration_range=_salary_iteration_range(model),
+        )
+
+    splits, predictions = table
+    index = 0
+    for feature in SALARY_FEATURES:
+        # XGBoost compares float32 inputs against float32 thresholds and goes right when x >= split
+        values = features[feature].cast(pl.Float32).to_numpy()
+        cell = np.where(np.isnan(values), len(splits[feature]) + 1, np.searchsorted(splits[feature], values, 'right'))
+        index = index * (len(splits[feature]) + 2) + cell
+    return predictions[index]
+
+
+def predict_salaries(features):
+    """
+    Predict next-contract salaries with the XGBoost model. Identical feature rows are predicted
+    once, and predictions are memoised across calls in an LRU joined on the feature columns.
+
+    :param features: DataFrame with the SALARY_FEATURES columns; a null salary means no contract
+    :return: Float32 Series of predictions aligned with the rows of features
+    """
+    global _salary_memo, _salary_memo_tick
+
+    features = features.select(pl.col(SALARY_FEATURES).cast(pl.Float32))
+    resolved = features.unique().join(
+        _salary_memo.select(*SALARY_FEATURES, 'prediction'), on=SALARY_FEATURES, how='left', nulls_equal=True
+    )
+    missing = resolved.filter(pl.col('prediction').is_null())
+    if missing.height:
+        resolved = pl.concat([
+            resolved.filter(pl.col('prediction').is_not_null()),
+            missing.with_columns(prediction=pl.Series(_predict_salary_rows(missing), dtype=pl.Float32)),
+        ])
+
+    with _salary_memo_lock:
+        _salary_memo_tick += 1
+        _salary_memo = pl.concat([
+            _salary_memo.join(resolved.select(SALARY_FEATURES), on=SALARY_FEATURES, how='anti', nulls_equal=True),
+            resolved.select(*SALARY_FEATURES, 'prediction', used=pl.lit(_salary_memo_tick, dtype=pl.UInt64)),
+        ])
+        if _salary_memo.height > SALARY_MEMO_SIZE:
+            _salary_memo = _salary_memo.top_k(SALARY_MEMO_SIZE, by='used')
+
+    return (
+        features
+        .join(resolved, on=SALARY_FEATURES, how='left', nulls_equal=True, maintain_order='left')['prediction']
+        .alias('prediction')
+    )
@@ -1,19 +1,52 @@
+from collections import OrderedDict
+from functools import cache
+import threading
+
 import plotly.graph_objects as go
+import plotly.io as pio
 import polars as pl
-import numpy as np
+import streamlit as st
 
 
-def player_plot(df, pid):
-    plot_df = df.filter(pl.col('pid') == pid)
-    player = plot_df.select(pl.first('player')).item()
-    title = player
+@cache
+def _base_layout():
+    # Expanding the template is most of the cost of a figure; validate it once and share it
+    return go.Layout(
+        template='simple_white',
+        barmode='group',
+        yaxis=dict(
+            range=[0, 100],
+            showgrid=True,
+            showticklabels=True,
+        ),
+        yaxis2=dict(
+            range=[0, 50],
+            overlaying='y',
+            side='right',
+            showgrid=False,
+            showticklabels=False,
+        ),
+    )
 
-    fig = go.Figure()
+
+def player_figure(plot_df):
+    """
+    Career figure of one player: ovr, surplus, value and current and projected salary by season.
+
+    :param plot_df: Rows of a single player, see hgm.data.index.PlayerIndex.player
+    """
+    plot_df = plot_df.with_columns(
+        value_text=pl.format('${}', pl.col('value').round(2)),
+        salary_text=pl.format('${}', pl.col('salary').round(2)),
+    )
+    current = plot_df.filter(pl.col('status') == 'current')
+    projected = plot_df.filter(pl.col('status') == 'next')
+    title = plot_df['player'][0]
 
     bar_width = 0.4
 
-    # OVERALL
-    fig.add_trace(
+    data = [
+        # OVERALL
         go.Scatter(
             x=plot_df['season'],
             y=plot_df['ovr'],
@@ -24,11 +57,8 @@ def player_plot(df, pid):
             hovertemplate=
             '<b>Season</b>: %{x}<br>' +
             '<b>Overall</b>: %{y:.1f}<br>'  # Round to 1 decimal place
-        )
-    )
-
-    # SURPLUS
-    fig.add_trace(
+        ),
+        # SURPLUS
         go.Scatter(
             x=plot_df['season'],
             y=plot_df['surplus'],
@@ -37,11 +67,8 @@ def player_plot(df, pid):
                 color='rgb(0, 90, 95)'
             ),
             yaxis='y2'
-        )
-    )
-
-    # VALUE
-    fig.add_trace(
+        ),
+        # VALUE
         go.Bar(
             x=plot_df['season'] + 0.2,
             y=plot_df['value'],
@@ -51,73 +78,171 @@ def player_plot(df, pid):
             marker=dict(
                 color='rgb(0, 166, 153)'
             ),
-            text=[f'${np.round(val, 2)}' for val in list(plot_df['value'])],
+            text=plot_df['value_text'],
             textposition='outside',
             textfont=dict(
                 color='rgb(0, 166, 153)',
                 size=14,
             ),
-        )
-    )
-
-    # SALARY
-    fig.add_trace(
+        ),
+        # SALARY
         go.Bar(
-            x=plot_df.filter(pl.col('status') == 'current')['season'] - 0.2,
-            y=plot_df.filter(pl.col('status') == 'current')['salary'],
+            x=current['season'] - 0.2,
+            y=current['salary'],
             name='Salary',
             yaxis='y2',
             width=bar_width,
             marker=dict(
                 color='rgb(252,100,45)'
             ),
-            text=[f'${np.round(val, 2)}' for val in list(plot_df.filter(pl.col('status') == 'current')['salary'])],
+            text=current['salary_text'],
             textposition='outside',
             textfont=dict(
                 color='rgb(252,100,45)',
                 size=14,
             ),
-        )
-    )
-
-    # Salaries (ProjecteD)
-    fig.add_trace(
+        ),
+        # Salaries (ProjecteD)
         go.Bar(
-            x=plot_df.filter(pl.col('status') == 'next')['season'] - 0.2,
-            y=plot_df.filter(pl.col('status') == 'next')['salary'],
+            x=projected['season'] - 0.2,
+            y=projected['salary'],
             name='Salary',
             yaxis='y2',
             width=bar_width,
             marker=dict(
                 color='rgba(252,100,45,0.5)'
             ),
-            text=[f'${np.round(val, 2)}' for val in list(plot_df.filter(pl.col('status') == 'next')['salary'])],
+            text=projected['salary_text'],
             textposition='outside',
             textfont=dict(
                 color='rgb(252,100,45)',
                 size=14,
             ),
             showlegend=False,
-        )
-    )
-
-    # Update the plot title
-    fig.update_layout(
-        template='simple_white',
-        title=title,
-        barmode='group',
-        yaxis=dict(
-            range=[0, 100],
-            showgrid=True,
-            showticklabels=True,
-        ),
-        yaxis2=dict(
-            range=[0, 50],
-            overlaying='y',
-            side='right',
-            showgrid=False,
-            showticklabels=False,
         ),
-    )
+    ]
 
+    fig = go.Figure(data=data, layout=_base_layout())
+    fig.update_layout(title=title)
     return fig
+
+
+def player_plot(df, pid):
+    return player_figure(df.filter(pl.col('pid') == pid))
+
+
+def player_plots(df, pids):
+    """
+    Figures of several players, splitting df by pid once instead of filtering it per player.
+
+    :return: Dict of pid -> figure for the pids found in df, in the order of pids
+    """
+    by_pid = df.filter(pl.col('pid').is_in(pids)).partition_by('pid', as_dict=True)
+    return {pid: player_figure(by_pid[(pid,)]) for pid in pids if (pid,) in by_pid}
+
+
+# %%
+# Bump whenever player_figure changes, so cached figures of the old style are not served
+PLOT_VERSION = 1
+
+
+class FigureCache:
+    """
+    Process-wide LRU cache of player figures, keyed by (league hash, pid, PLOT_VERSION). A player's
+    rows never change within a loaded league, so neither does their figure. Figures are kept as
+    compact Plotly JSON, and the most recently drawn ones also as the Figures rebuilt from it.
+    """
+
+    def __init__(self, max_figures=2048, max_built=256):
+        self.max_figures = max_figures
+        self.max_built = max_built
+        self._figures = OrderedDict()
+        self._built = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._figures)
+
+    def _lookup(self, store, key):
+        with self._lock:
+            if key in store:
+                store.move_to_end(key)
+                return store[key]
+        return None
+
+    def _insert(self, store, key, value, limit):
+        with self._lock:
+            store[key] = value
+            while len(store) > limit:
+                store.popitem(last=False)
+
+    def get(self, league_key, pid, plot_df=None):
+        """
+        Return the JSON figure of pid, building it from plot_df on a miss.
+
+        :param plot_df: Rows of the player; None to only look up
+        :return: JSON string, or None if missing and no rows were given
+        """
+        key = (league_key, pid, PLOT_VERSION)
+        spec = self._lookup(self._figures, key)
+        if spec is not None:
+            return spec
+        if plot_df is None or plot_df.is_empty():
+            return None
+        spec = pio.to_json(player_figure(plot_df), validate=False)
+        self._insert(self._figures, key, spec, self.max_figures)
+        return spec
+
+    def figure(self, league_key, pid, plot_df=None):
+        """
+        Return the figure of pid, rebuilt from its JSON on a miss. The figure is shared by every
+        session drawing pid, so treat it as read-only; copy it with go.Figure(figure) to change it.
+
+        :param plot_df: Rows of the player; None to only look up
+        :return: go.Figure, or None if missing and no rows were given
+        """
+        key = (league_key, pid, PLOT_VERSION)
+        figure = self._lookup(self._built, key)
+        if figure is not None:
+            return figure
+        spec = self.get(league_key, pid, plot_df)
+        if spec is None:
+            return None
+        figure = pio.from_json(spec)
+        self._insert(self._built, key, figure, self.max_built)
+        return figure
+
+    def warm(self, league_key, index, pids):
+        """
+        Build the figures of the pids that are not cached yet, both as JSON and as Figures, so
+        drawing them later is a dictionary lookup. Keep pids within max_built.
+        """
+        for pid in pids:
+            self.figure(league_key, pid, index.player(pid))
+
+    def warm_in_background(self, league_key, index, pids):
+        """Build the figures of pids in a daemon thread, so the caller does not wait for them."""
+        thread = threading.Thread(target=self.warm, args=(league_key, index, list(pids)), daemon=True)
+        thread.start()
+        return thread
+
+
+@st.cache_resource
+def figure_cache():
+    return FigureCache()
+
+
+def cached_player_plots(index, pids):
+    """
+    Figures of several players of the league in session, served from figure_cache, so players
+    drawn before, in any session, cost no figure construction.
+
+    :param index: PlayerIndex of the league in session
+    :return: List of figures, in the order of pids, skipping unknown pids; shared, read-only
+    """
+    league_key = st.session_state.get('league_key')
+    if league_key is None:
+        return list(player_plots(index.players(pids), pids).values())
+    cache = figure_cache()
+    figures = [cache.figure(league_key, pid, index.player(pid)) for pid in pids]
+    return [figure for figure in figures if figure is not None]
@@ -0,0 +1,86 @@
+import polars as pl
+import streamlit as st
+
+# Row filters the pages offer as checkboxes, by label
+PREDICATES = {
+    'Upcoming FA': pl.col('years') == 1,
+    'Dead Weight': (pl.col('years') > 1) & (pl.col('cv_total') < 0),
+}
+
+
+# %%
+def partition_players(players):
+    """
+    Split processed players into one frame per season and team.
+
+    :return: Dict of season -> dict of team -> DataFrame
+    """
+    partitions = {}
+    for (season, team), partition in players.partition_by(['season', 'team'], as_dict=True).items():
+        partitions.setdefault(season, {})[team] = partition
+    return partitions
+
+
+def _run_query(partitions, season, columns, teams, exclude_teams, positions, predicates, sort, descending):
+    by_team = partitions.get(season, {})
+    if teams is None:
+        teams = [team for team in by_team if team not in exclude_teams]
+    frames = [by_team[team] for team in teams if team in by_team and team not in exclude_teams]
+    if not frames:
+        # Empty result with the league's schema
+        frames = [next(frame for season_frames in partitions.values() for frame in season_frames.values()).clear()]
+
+    df = pl.concat(frames)
+    if positions is not None:
+        df = df.filter(pl.col('pos').is_in(positions))
+    if predicates:
+        df = df.filter(*[PREDICATES[predicate] for predicate in predicates])
+    df = df.select(columns)
+    if sort is not None:
+        df = df.sort(sort, descending=descending)
+    return df
+
+
+@st.cache_resource(max_entries=8)
+def _partitions(league_key, _players):
+    return partition_players(_players)
+
+
+@st.cache_resource(max_entries=256)
+def _query(league_key, season, columns, teams, exclude_teams, positions, predicates, sort, descending, _players):
+    return _run_query(
+        _partitions(league_key, _players), season, columns, teams, exclude_teams, positions, predicates, sort, descending
+    )
+
+
+def query_players(players, season, columns, teams=None, exclude_teams=(), positions=None, predicates=(),
+                  sort=None, descending=True):
+    """
+    One season of the players in session, filtered and sorted. The league is split once into
+    per-(season, team) frames, so a query only concatenates the teams it asks for, and every
+    result is kept per (league, query) and shared by all reruns and sessions viewing that league.
+
+    :param players: The full processed players of the league in session, never a filtered frame,
+        since results are cached under the league's key
+    :param columns: Column names to keep, in display order
+    :param teams: Team names to keep; None for every team
+    :param exclude_teams: Team names to drop, e.g. 'Draft'
+    :param positions: Positions to keep; None for every position
+    :param predicates: Labels of PREDICATES rows must all satisfy
+    :param sort: Column to sort by, if any
+    :return: DataFrame of columns
+    """
+    query = (
+        season,
+        tuple(columns),
+        None if teams is None else tuple(teams),
+        tuple(exclude_teams),
+        None if positions is None else tuple(positions),
+        tuple(predicates),
+        sort,
+        descending,
+    )
+    league_key = st.session_state.get('league_key')
+    if league_key is None:
+        return _run_query(partition_players(players), *query)
+    return _query(league_key, *query, players)
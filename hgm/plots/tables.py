@@ -0,0 +1,52 @@
+import polars as pl
+import streamlit as st
+
+
+# %%
+def number(precision):
+    """Column style of a plain number shown with precision decimals."""
+    return {'precision': precision}
+
+
+def gradient(vmin, vmax, precision=2, inverse=False):
+    """
+    Column style of a number shaded between vmin and vmax. The grid draws it as a bar that is
+    green above the middle of the range and red below it, or the other way round if inverse.
+    """
+    return {'precision': precision, 'range': (vmin, vmax), 'inverse': inverse}
+
+
+def column_config(styles):
+    """Streamlit column configs of a dict of column -> style, see number and gradient."""
+    config = {}
+    for column, style in styles.items():
+        number_format = f'%.{style["precision"]}f'
+        if 'range' in style:
+            vmin, vmax = style['range']
+            config[column] = st.column_config.ProgressColumn(
+                format=number_format, min_value=vmin, max_value=vmax,
+                color='auto-inverse' if style['inverse'] else 'auto',
+            )
+        else:
+            config[column] = st.column_config.NumberColumn(format=number_format)
+    return config
+
+
+# %%
+def select_rows(df, styles, select_column='Select'):
+    """
+    Show df as a read-only grid with a leading checkbox column and return the rows ticked.
+    The frame goes to the grid as Arrow data; formatting and shading are column configs applied
+    by the grid itself, so nothing is converted to pandas or styled cell by cell.
+
+    :param styles: Dict of column -> style, see number and gradient
+    :return: DataFrame of the ticked rows of df
+    """
+    edited = st.data_editor(
+        df.select(pl.lit(False).alias(select_column), pl.all()),
+        hide_index=True,
+        column_config={select_column: st.column_config.CheckboxColumn(required=True), **column_config(styles)},
+        disabled=df.columns,
+        width='stretch',
+    )
+    return edited.filter(pl.col(select_column)).drop(select_column)
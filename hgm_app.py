@@ -1,7 +1,9 @@
-import streamlit as st
 import polars as pl
-from hgm.data.process_data import load_and_process_players
-from hgm.config import DATA_DIR
+import streamlit as st
+from hgm.data.cache import cached_league, league_key
+from hgm.data.league import process_league
+from hgm.data.store import LeagueStore
+from hgm.plots.player_plots import figure_cache
 
 # Set page configuration with Bootstrap theme
 st.set_page_config(
@@ -11,81 +13,33 @@ st.set_page_config(
 )
 
 
+@st.cache_resource
+def league_store():
+    return LeagueStore()
+
+
 def upload_json():
     return st.file_uploader('Upload a JSON file', type='json')
 
 
-def load_teams(json_data):
-    # logger.info('Loading teams')
-    return (
-        json_data.select('teams').explode('teams').unnest('teams')
-        .filter(pl.col('disabled') == False)
-        .select('tid', pl.col('abbrev').alias('team'), )
-        .extend(pl.DataFrame({'tid': [-2, -1], 'team': ['Draft', 'FA']}))
+def select_loaded_league(store):
+    # Only leagues this session loaded itself; the store is shared with every other user
+    session_keys = st.session_state.setdefault('loaded_leagues', set())
+    loaded = {key: name for key, name in store.names().items() if key in session_keys}
+    if not loaded:
+        return None
+    return st.selectbox(
+        'Open a league you already loaded',
+        options=[None, *loaded],
+        format_func=lambda key: 'Upload a new league' if key is None else loaded[key]
     )
 
 
-def load_players(json_data, team_data, settings):
-    # logger.info('Loading players')
-    n_teams = int(32)
-    players_raw = json_data.select('players').explode('players').unnest('players').lazy()
-    birth_places = (
-        players_raw
-        .select(pl.col('pid'), pl.col('born'))
-        .unnest('born')
-        .select(
-            pl.col('pid'),
-            pl.col('loc').str.split(', ').list[-1].alias('country')
-        )
-    )
-    progression = pl.scan_parquet(DATA_DIR / 'constants' / 'calculated_progs.parquet')
-    return (
-        load_and_process_players(players_raw, progression, settings)
-        .join(birth_places.collect(), on='pid', how='left')
-        .join(team_data, on='tid', how='left')
-        .with_columns(is_current=pl.col('status') == 'current')
-        .with_columns(years=pl.col('is_current').sum().over('pid'))
-        .with_columns(max_value=pl.col('value').max().over('pid'))
-        .with_columns(sum_value=pl.col('value').sum().over('pid'))
-        .with_columns(p_rk=pl.col('ovr').rank(method='ordinal', descending=True).over(['season', 'pos']))
-        .with_columns(
-            is_prospect=pl.when((pl.col('age') <= 21) & (pl.col('team') != 'Draft')).then(pl.lit(True)).otherwise(
-                pl.lit(False)))
-        .with_columns(pr_rk=(
-            pl.when(pl.col('is_prospect') == True)
-            .then(pl.col('sum_value').rank(method='ordinal', descending=True).over(['season', 'is_prospect']))
-            .otherwise(pl.lit(None))
-        ))
-        .with_columns(pr_rk_pos=(
-            pl.when(pl.col('is_prospect') == True)
-            .then(pl.col('sum_value').rank(method='ordinal', descending=True).over(['season', 'pos', 'is_prospect']))
-            .otherwise(pl.lit(None))
-        ))
-        .with_columns(line=(
-            pl.when((pl.col('pos') == 'G') & (pl.col('p_rk') <= n_teams)).then(pl.lit('Starter'))
-            .when((pl.col('pos') == 'G') & (pl.col('p_rk').is_between(n_teams + 1, 2 * n_teams))).then(pl.lit('Backup'))
-            .when((pl.col('pos') == 'C') & (pl.col('p_rk') <= n_teams)).then(pl.lit('1st Line'))
-            .when((pl.col('pos') == 'C') & (pl.col('p_rk').is_between(n_teams + 1, 2 * n_teams))).then(
-                pl.lit('2nd Line'))
-            .when((pl.col('pos') == 'C') & (pl.col('p_rk').is_between(2 * n_teams + 1, 3 * n_teams))).then(
-                pl.lit('3rd Line'))
-            .when((pl.col('pos') == 'C') & (pl.col('p_rk').is_between(3 * n_teams + 1, 4 * n_teams))).then(
-                pl.lit('4th Line'))
-            .when((pl.col('pos') == 'W') & (pl.col('p_rk') <= 2 * n_teams)).then(pl.lit('1st Line'))
-            .when((pl.col('pos') == 'W') & (pl.col('p_rk').is_between(2 * n_teams + 1, 4 * n_teams))).then(
-                pl.lit('2nd Line'))
-            .when((pl.col('pos') == 'W') & (pl.col('p_rk').is_between(4 * n_teams + 1, 6 * n_teams))).then(
-                pl.lit('3rd Line'))
-            .when((pl.col('pos') == 'W') & (pl.col('p_rk').is_between(6 * n_teams + 1, 8 * n_teams))).then(
-                pl.lit('4th Line'))
-            .when((pl.col('pos') == 'D') & (pl.col('p_rk') <= 2 * n_teams)).then(pl.lit('1st Pair'))
-            .when((pl.col('pos') == 'D') & (pl.col('p_rk').is_between(2 * n_teams + 1, 4 * n_teams))).then(
-                pl.lit('2nd Pair'))
-            .when((pl.col('pos') == 'D') & (pl.col('p_rk').is_between(4 * n_teams + 1, 6 * n_teams))).then(
-                pl.lit('3rd Pair'))
-            .otherwise(pl.lit('Reserve'))
-        ))
-    )
+def warm_user_team(key, league):
+    # Draw the user's own roster ahead of time; those are the player cards opened first
+    settings = league['game_settings']
+    roster = league['index'].season(settings['season']).filter(pl.col('tid') == settings['userTid'][-1]['value'])
+    figure_cache().warm_in_background(key, league['index'], roster['pid'].to_list())
 
 
 def main():
@@ -94,19 +48,27 @@ def main():
 
     if st.button("Clear Data"):
         st.session_state['data'] = None
+        st.session_state['league_key'] = None
         st.rerun()
 
     if not st.session_state['data']:
-        json_file = upload_json()
-        pl_json = pl.read_json(json_file)
-        game_settings = pl_json.select('gameAttributes').item()
-        teams = load_teams(pl_json)
-        players = load_players(pl_json, teams, game_settings)
-        st.session_state['data'] = {
-            'game_settings': game_settings,
-            'teams': teams,
-            'players': players
-        }
+        store = league_store()
+        key = select_loaded_league(store)
+        if key is None:
+            json_file = upload_json()
+            if json_file is None:
+                st.stop()
+            key = league_key(json_file)
+            league = store.get(key, lambda: cached_league(json_file, process_league, key=key)[1], name=json_file.name)
+        else:
+            league = store.get(key)
+            if league is None:
+                st.rerun()
+        # Sessions only hold a reference to the shared, read-only league
+        st.session_state['league_key'] = key
+        st.session_state['data'] = league
+        st.session_state['loaded_leagues'].add(key)
+        warm_user_team(key, league)
         st.success('Data loaded successfully.')
     else:
         st.success('Data already loaded.')
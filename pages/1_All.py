@@ -1,7 +1,9 @@
 import streamlit as st
 import polars as pl
 
-from hgm.plots.player_plots import player_plot
+from hgm.plots.player_plots import cached_player_plots
+from hgm.plots.queries import PREDICATES, query_players
+from hgm.plots.tables import gradient, number, select_rows
 
 # Set page configuration with Bootstrap theme
 st.set_page_config(
@@ -17,6 +19,13 @@ def safe_load_players():
         st.stop()
 
 
+def safe_load_index():
+    if 'data' in st.session_state:
+        return st.session_state['data']['index']
+    else:
+        st.stop()
+
+
 def safe_load_teams():
     if 'data' in st.session_state:
         return st.session_state['data']['teams']
@@ -54,107 +63,81 @@ def select_teams(df: pl.DataFrame):
     return selected_teams
 
 
-def filter_teams(df, selected_teams):
+def team_query(selected_teams):
     if selected_teams != ['*All*']:
-        return df.filter(pl.col('team').is_in(selected_teams))
+        return {'teams': selected_teams}
     else:
-        return df.filter(pl.col('team') != 'Draft')
+        return {'exclude_teams': ['Draft']}
+
+
+TABLE_STYLES = {
+    'pid': number(0),
+    'age': number(0),
+    'p_rk': number(0),
+    'ovr': gradient(10, 100, precision=0),
+    'pot': gradient(10, 100, precision=0),
+    'years': gradient(0, 10, precision=0, inverse=True),
+    'salary': gradient(-25, 25),
+    'value': gradient(-25, 25),
+    'sum_value': gradient(-200, 200),
+    'cv_current': gradient(-75, 75),
+    'cv_next': gradient(-75, 75),
+    'cv_total': gradient(-100, 100),
+}
 
 
 def display_and_select_pids(df):
-    df = df.to_pandas()
     if 'selected_pids' not in st.session_state:
         st.session_state.selected_pids = []
 
-    df_with_selections = df.copy()
-    df_with_selections.insert(0, "Select", False)
-
-    # Get dataframe row-selections from user with st.data_editor
-    edited_df = st.data_editor(
-        (
-            df_with_selections
-            .style
-            .format(precision=0, subset=['pid', 'age', 'ovr', 'pot', 'p_rk'])
-            .format(precision=2, subset=['cv_current', 'cv_next', 'cv_total', 'value', 'salary', 'sum_value'])
-            .background_gradient(cmap='RdBu_r', vmin=10, vmax=100, subset=['ovr', 'pot'])
-            .background_gradient(cmap='RdBu_r', vmin=-75, vmax=75, subset=['cv_current'])
-            .background_gradient(cmap='RdBu_r', vmin=-75, vmax=75, subset=['cv_next'])
-            .background_gradient(cmap='RdBu_r', vmin=-100, vmax=100, subset=['cv_total'])
-            .background_gradient(cmap='RdBu_r', vmin=-200, vmax=200, subset=['sum_value'])
-            .background_gradient(cmap='RdBu_r', vmin=-25, vmax=25,
-                                 subset=['value'])
-            .background_gradient(cmap='RdBu_r', vmin=-25, vmax=25, subset=['salary'])
-            .background_gradient(cmap='RdBu', vmin=0, vmax=10, subset=['years'])
-        )
-        ,
-        hide_index=True,
-        column_config={"Select": st.column_config.CheckboxColumn(required=True)},
-        disabled=df.columns,
-        use_container_width=True
-    )
-
-    # Filter the dataframe using the temporary column, then drop the column
-    selected_pids = list(set(edited_df[edited_df.Select]['pid'].to_list() + st.session_state.selected_pids))
+    selected = select_rows(df, TABLE_STYLES)
+    selected_pids = list(set(selected['pid'].to_list() + st.session_state.selected_pids))
     return selected_pids
 
 
 def main():
     players = safe_load_players()
+    index = safe_load_index()
     teams = safe_load_teams()
     settings = safe_load_settings()
     my_team_id = settings['userTid'][-1]['value']
+    current = index.season(settings['season'])
     st.markdown(
         f"Season: {settings['season']}, "
-        f"My Team: {players.filter(pl.col('tid') == my_team_id).select(pl.first('team')).item()}"
+        f"My Team: {current.filter(pl.col('tid') == my_team_id).select(pl.first('team')).item()}"
     )
 
     selected_teams = select_teams(teams)
-
-    df_filtered = filter_teams(players, selected_teams)
     selected_position = st.selectbox('Select Position', options=['All', 'C', 'W', 'D', 'G'])
-    if selected_position != 'All':
-        df_filtered = df_filtered.filter(pl.col('pos') == selected_position)
 
     if st.button('Clear selected players'):
         st.session_state['selected_pids'] = []
 
     seasons_ahead = st.checkbox('Next Year')
 
-    df_display = (
-        df_filtered
-        .filter(pl.col('season') == settings['season'] + seasons_ahead)
-        .select(
+    filter_columns = st.columns(2)
+    predicates = [
+        predicate for column, predicate in zip(filter_columns, PREDICATES) if column.checkbox(predicate)
+    ]
+
+    df_display = query_players(
+        players,
+        settings['season'] + seasons_ahead,
+        [
             'player', 'pid', 'team', 'pos', 'age', 'p_rk', 'line', 'ovr', 'pot', 'years', 'salary',
-            pl.col('value'), pl.col('sum_value'),
-            pl.col('cv_current'), pl.col('cv_next'), pl.col('cv_total')
-        )
-        .sort('ovr', descending=True)
+            'value', 'sum_value', 'cv_current', 'cv_next', 'cv_total',
+        ],
+        **team_query(selected_teams),
+        positions=None if selected_position == 'All' else [selected_position],
+        predicates=predicates,
+        sort='ovr',
     )
 
-    filter_dict = {
-        'Upcoming FA': (pl.col('years') == 1),
-        'Dead Weight': (pl.col('years') > 1) & (pl.col('cv_total') < 0)
-    }
-
-    filters_to_apply = []
-
-    filter_columns = st.columns(2)
-    for i, filter_type in enumerate(filter_dict.keys()):
-        selection = filter_columns[i].checkbox(filter_type)
-        if selection:
-            filters_to_apply.append(filter_dict[filter_type])
-
-    if filters_to_apply:
-        df_display = df_display.filter(filters_to_apply)
-
     st.session_state['selected_pids'] = display_and_select_pids(df_display)
 
     selected_df = (
-        players
-        .filter(
-            (pl.col('season') == settings['season']) &
-            (pl.col('pid').is_in(st.session_state['selected_pids']))
-        )
+        index
+        .players(st.session_state['selected_pids'], season=settings['season'])
         .select(
             'player', 'team', 'pos', 'age', 'p_rk', 'pr_rk', 'ovr', pl.col('pot').round(0), 'years', 'salary',
             'sum_value',
@@ -182,12 +165,11 @@ def main():
         with col2:
             st.dataframe(selected_by_team_df, hide_index=True)
 
-    [st.plotly_chart(player_plot(players, pid), use_container_width=True)
-     for pid in st.session_state['selected_pids']]
+    [st.plotly_chart(fig, use_container_width=True)
+     for fig in cached_player_plots(index, st.session_state['selected_pids'])]
 
     st.dataframe(
-        players
-        .filter(pl.col('season') == settings['season'] + 0)
+        current
         .filter(pl.col('tid') >= 0)
         .select(
             'team',
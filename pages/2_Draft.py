@@ -1,6 +1,8 @@
 import streamlit as st
 import polars as pl
 
+from hgm.plots.tables import gradient, number, select_rows
+
 # Set page configuration with Bootstrap theme
 st.set_page_config(
     page_title='Splunk CIM Selection',
@@ -41,22 +43,9 @@ def main():
             (pl.col('tid') == -2) & (pl.col('season') == game_settings['season']) & (
                     pl.col('draft_year') == game_settings['season'])
         )
+        # Upside: total value of a career that stays on the 90th percentile of its progression
         .with_columns(
-            c_upper_bound=6 * 10 ** -6 * (pl.col('ovr') + 7) ** 4.0923,
-            w_upper_bound=1 * 10 ** -8 * (pl.col('ovr') + 6) ** 5.6462,
-            d_upper_bound=5 * 10 ** -5 * (pl.col('ovr') + 8) ** 3.5338,
-            g_upper_bound=0.005 * (pl.col('ovr') + 10) ** 2.3515,
-        )
-        .with_columns(
-            upper=(
-                pl.when(pl.col('pos') == 'C')
-                .then(pl.col('c_upper_bound'))
-                .when(pl.col('pos') == 'W')
-                .then(pl.col('w_upper_bound'))
-                .when(pl.col('pos') == 'D')
-                .then(pl.col('d_upper_bound'))
-                .otherwise(pl.col('g_upper_bound'))
-            )
+            upper=pl.col('sum_value_p90')
         )
         .with_columns(
             sort_value=(3 * pl.col('max_value') + pl.col('sum_value')) / 10,
@@ -108,38 +97,25 @@ def main():
             )
         )
 
-    draft = draft.to_pandas()
-
-    draft.insert(0, "Drafted", False)
+    display_columns = ['player', 'pos', 'age', 'ovr', 'pot', 'sum_value', 'value', 'upper', 'sort_value', 'comp', 'comp_z']
+    styles = {
+        'age': number(0),
+        'ovr': gradient(10, 70, precision=0),
+        'pot': gradient(10, 70, precision=0),
+        # Shade up to the best of the class; an empty class still needs a non-empty range
+        **{column: gradient(0, max(draft[column].max() or 0, 1), precision=1)
+           for column in ['sum_value', 'value', 'upper', 'sort_value', 'comp', 'comp_z']},
+    }
 
     # Get dataframe row-selections from user with st.data_editor
     st.markdown("""# Draft Guide""", unsafe_allow_html=True)
     st.markdown("""------------------------------""")
     st.markdown("""### Available Players""", unsafe_allow_html=True)
 
-    edited_df = st.data_editor(
-        draft[
-            ['player', 'pos', 'age', 'ovr', 'pot', 'sum_value', 'value', 'upper', 'sort_value', 'comp','comp_z']]
-        .sort_values('sort_value', ascending=False).style
-        .background_gradient(cmap='RdBu_r', vmin=10, vmax=70,
-                             subset=['ovr', 'pot'])
-        .background_gradient(cmap='RdBu_r', vmin=0, vmax=draft['sum_value'].max(),
-                             subset=['sum_value'])
-        .background_gradient(cmap='RdBu_r', vmin=0, vmax=draft[draft.Drafted == False]['sort_value'].max(),
-                             subset=['sort_value'])
-        .background_gradient(cmap='RdBu_r', vmin=0, vmax=draft[draft.Drafted == False]['value'].max(),
-                             subset=['value'])
-        .background_gradient(cmap='RdBu_r', vmin=0, vmax=draft[draft.Drafted == False]['upper'].max(),
-                             subset=['upper'])
-        .background_gradient(cmap='RdBu_r', vmin=0, vmax=draft[draft.Drafted == False]['comp'].max(),
-                             subset=['comp'])
-        .background_gradient(cmap='RdBu_r', vmin=0, vmax=draft[draft.Drafted == False]['comp_z'].max(),
-                                subset=['comp_z'])
-        .format(precision=1)
-        .format(precision=0, subset=['ovr', 'pot']),
-        hide_index=True,
-        disabled=['max_value', 'sum_value', 'sort_value', 'short', 'long', 'value', 'upper', 'comp','comp_z', 'ovr', 'pot'],
-        use_container_width=True
+    select_rows(
+        draft.select(display_columns).sort('sort_value', descending=True),
+        styles,
+        select_column='Drafted',
     )
 
 
@@ -1,7 +1,7 @@
 import streamlit as st
 import polars as pl
 import numpy as np
-from hgm.config import DATA_DIR
+from hgm.data.contracts import SALARY_GRID, contract_ecdfs, evaluate_offers, grade_salaries
 
 # Set page configuration with Bootstrap theme
 st.set_page_config(
@@ -24,44 +24,6 @@ def safe_load_settings():
         st.stop()
 
 
-def calculate_percentile(df: pl.DataFrame, column: str, value: float) -> float:
-    """
-    Calculate the percentile of a given value in a Polars DataFrame column.
-
-    :param df: Polars DataFrame
-    :param column: Name of the column to calculate percentile for
-    :param value: Value to find the percentile for
-    :return: Percentile as a float between 0 and 100
-    """
-    # Extract the column as a numpy array
-    col_values = df[column].to_numpy()
-
-    # Calculate the percentile
-    percentile = (col_values < value).mean() * 100
-
-    return percentile
-
-def calculate_letter_grade(percentile: float) -> str:
-    """
-    Calculate the letter grade for a given percentile.
-
-    :param percentile: Percentile as a float between 0 and 100
-    :return: Letter grade as a string
-    """
-    if percentile >= 95:
-        return 'A+'
-    elif percentile >= 90:
-        return 'A'
-    elif percentile >= 75:
-        return 'B'
-    elif percentile >= 50:
-        return 'C'
-    elif percentile >= 25:
-        return 'D'
-    else:
-        return 'F'
-
-
 def main():
     settings = safe_load_settings()
     my_team_id = settings['userTid'][-1]['value']
@@ -70,10 +32,10 @@ def main():
         .with_columns(info=pl.col('player') + ' (' + pl.col('team') + ')' + ' - ' + pl.col('pid').cast(pl.String))
         .sort(pl.col('pid'))
     )
-    contracts = pl.read_parquet(f'{DATA_DIR}/processed/contracts.parquet')
+    ecdfs = contract_ecdfs()
 
     st.write(
-        calculate_percentile(df=contracts, column='avg_surplus', value=1.5)
+        float(ecdfs['avg_surplus'].percentile(1.5))
     )
 
     selection = st.selectbox(
@@ -94,45 +56,46 @@ def main():
     is_in_season = st.checkbox('In-season signing')
 
     num_options = 8
+    values = df_filtered.sort('season')['value'].to_numpy()
+
+    # Read every offer first; the whole grid and the typed offers are then graded in one batch
+    option_containers = [st.container() for _ in range(num_options)]
+    salaries = []
+    for i, option_container in enumerate(option_containers):
+        with option_container:
+            st.write(f'{i + 1} year contract')
+
+            # Get salary from the user
+            salaries.append(st.number_input('Enter the salary', min_value=0.0, max_value=14.0,
+                                            step=0.1, key=f'{i}salary'))
+
+    offers = (
+        evaluate_offers(values, salaries=np.union1d(SALARY_GRID, salaries), max_years=num_options, ecdfs=ecdfs)
+        .filter(pl.col('in_season') == is_in_season)
+    )
+    typed_offers = (
+        pl.DataFrame({'years': range(1, num_options + 1), 'salary': salaries})
+        .join(offers, on=['years', 'salary'], how='left', maintain_order='left')
+    )
 
-    for i in range(num_options):
-        st.write(f'{i + 1} year contract')
-        num_years = i + 1
-
-        # Get salary from the user
-        salary = st.number_input('Enter the salary', min_value=0.0, max_value=14.0,
-                                 step=0.1, key=f'{i}salary')
-
-        new_salaries = pl.Series('salary', [salary] * num_years, dtype=pl.Float64)
-
-        # Adjust the value calculation based on the in-season checkbox
-        if is_in_season:
-            new_values = df_filtered['value'][0:num_years]
-        else:
-            new_values = df_filtered['value'][1:1 + num_years]
-
-        new_surplus = new_values - new_salaries
-        total_cost = new_salaries.sum()
-        total_value = new_values.sum()
-        avg_surplus = new_surplus.mean()
-        total_surplus = new_surplus.sum()
-        avg_percentile = calculate_percentile(df=contracts, column='avg_surplus', value=avg_surplus)
-        total_percentile = calculate_percentile(df=contracts, column='total_surplus', value=total_surplus)
-        contract_grade = calculate_letter_grade(max(avg_percentile, total_percentile))
-
-        st.dataframe(
-            pl.DataFrame(
-                {
-                    'Total Cost': f'{np.round(total_cost, 2)}M',
-                    'Player Value': f'{np.round(total_value, 2)}M',
-                    'Avg. Surplus': f'{np.round(avg_surplus, 2)}M',
-                    'Total Surplus': f'{np.round(total_surplus, 2)}M',
-                    'Avg. %': f'{avg_percentile:.0f}%',
-                    'Total %': f'{total_percentile:.0f}%',
-                    'Grade': contract_grade
-                },
+    for option_container, offer in zip(option_containers, typed_offers.iter_rows(named=True)):
+        with option_container:
+            st.dataframe(
+                pl.DataFrame(
+                    {
+                        'Total Cost': f'{np.round(offer["total_cost"], 2)}M',
+                        'Player Value': f'{np.round(offer["total_value"], 2)}M',
+                        'Avg. Surplus': f'{np.round(offer["avg_surplus"], 2)}M',
+                        'Total Surplus': f'{np.round(offer["total_surplus"], 2)}M',
+                        'Avg. %': f'{offer["avg_percentile"]:.0f}%',
+                        'Total %': f'{offer["total_percentile"]:.0f}%',
+                        'Grade': offer['grade']
+                    },
+                )
             )
-        )
+
+    st.write('Most that can be paid for each grade')
+    st.dataframe(grade_salaries(offers).drop('pid', 'in_season'), hide_index=True)
 
 
 if __name__ == '__main__':
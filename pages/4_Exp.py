@@ -1,7 +1,9 @@
 import streamlit as st
 import polars as pl
 
-from hgm.plots.player_plots import player_plot
+from hgm.plots.player_plots import cached_player_plots
+from hgm.plots.queries import PREDICATES
+from hgm.plots.tables import gradient, number, select_rows
 
 # Set page configuration with Bootstrap theme
 st.set_page_config(
@@ -17,6 +19,13 @@ def safe_load_players():
         st.stop()
 
 
+def safe_load_index():
+    if 'data' in st.session_state:
+        return st.session_state['data']['index']
+    else:
+        st.stop()
+
+
 def safe_load_teams():
     if 'data' in st.session_state:
         return st.session_state['data']['teams']
@@ -61,50 +70,40 @@ def filter_teams(df, selected_teams):
     return df.filter(pl.col('player').is_in(expansion_players))
 
 
+TABLE_STYLES = {
+    'pid': number(0),
+    'age': number(0),
+    'p_rk': number(0),
+    'ovr': gradient(26, 80, precision=0),
+    'pot': gradient(26, 80, precision=0),
+    'years': gradient(0, 10, precision=0, inverse=True),
+    'salary': gradient(-13, 13),
+    'value': gradient(-15, 15),
+    'sum_value': gradient(-75, 75),
+    'cv_total': gradient(-50, 50),
+    'draft_v': gradient(-75, 75),
+}
+
+
 def display_and_select_pids(df):
-    df = df.to_pandas()
     if 'selected_pids' not in st.session_state:
         st.session_state.selected_pids = []
 
-    df_with_selections = df.copy()
-    df_with_selections.insert(0, "Select", False)
-
-    # Get dataframe row-selections from user with st.data_editor
-    edited_df = st.data_editor(
-        (
-            df_with_selections
-            .style
-            .format(precision=0, subset=['pid', 'age', 'ovr', 'pot', 'p_rk'])
-            .format(precision=2, subset=['cv_total', 'value', 'salary', 'sum_value', 'draft_v'])
-            .background_gradient(cmap='RdBu_r', vmin=26, vmax=80, subset=['ovr', 'pot'])
-            .background_gradient(cmap='RdBu_r', vmin=-50, vmax=50, subset=['cv_total'])
-            .background_gradient(cmap='RdBu_r', vmin=-75, vmax=75, subset=['sum_value'])
-            .background_gradient(cmap='RdBu_r', vmin=-75, vmax=75, subset=['draft_v'])
-            .background_gradient(cmap='RdBu_r', vmin=-15, vmax=15,
-                                 subset=['value'])
-            .background_gradient(cmap='RdBu_r', vmin=-13, vmax=13, subset=['salary'])
-            .background_gradient(cmap='RdBu', vmin=0, vmax=10, subset=['years'])
-        )
-        ,
-        hide_index=True,
-        column_config={"Select": st.column_config.CheckboxColumn(required=True)},
-        disabled=df.columns,
-        use_container_width=True
-    )
-
-    # Filter the dataframe using the temporary column, then drop the column
-    selected_pids = list(set(edited_df[edited_df.Select]['pid'].to_list() + st.session_state.selected_pids))
+    selected = select_rows(df, TABLE_STYLES)
+    selected_pids = list(set(selected['pid'].to_list() + st.session_state.selected_pids))
     return selected_pids
 
 
 def main():
     players = safe_load_players()
+    index = safe_load_index()
     teams = safe_load_teams()
     settings = safe_load_settings()
     my_team_id = settings['userTid'][-1]['value']
+    current = index.season(settings['season'])
     st.markdown(
         f"Season: {settings['season']}, "
-        f"My Team: {players.filter(pl.col('tid') == my_team_id).select(pl.first('team')).item()}"
+        f"My Team: {current.filter(pl.col('tid') == my_team_id).select(pl.first('team')).item()}"
     )
 
     selected_teams = select_teams(teams)
@@ -138,18 +137,10 @@ def main():
         .sort('draft_v', descending=True)
     )
 
-    filter_dict = {
-        'Upcoming FA': (pl.col('years') == 1),
-        'Dead Weight': (pl.col('years') > 1) & (pl.col('cv_total') < 0)
-    }
-
-    filters_to_apply = []
-
     filter_columns = st.columns(2)
-    for i, filter_type in enumerate(filter_dict.keys()):
-        selection = filter_columns[i].checkbox(filter_type)
-        if selection:
-            filters_to_apply.append(filter_dict[filter_type])
+    filters_to_apply = [
+        PREDICATES[predicate] for column, predicate in zip(filter_columns, PREDICATES) if column.checkbox(predicate)
+    ]
 
     if filters_to_apply:
         df_display = df_display.filter(filters_to_apply)
@@ -157,11 +148,8 @@ def main():
     st.session_state['selected_pids'] = display_and_select_pids(df_display)
 
     selected_df = (
-        players
-        .filter(
-            (pl.col('season') == settings['season']) &
-            (pl.col('pid').is_in(st.session_state['selected_pids']))
-        )
+        index
+        .players(st.session_state['selected_pids'], season=settings['season'])
         .select(
             'player', 'team', 'pos', 'age', 'p_rk', 'pr_rk', 'ovr', pl.col('pot').round(0), 'years', 'salary',
             pl.col('value').round(2), pl.col('cv_current').round(2), pl.col('cv_total').round(2)
@@ -181,12 +169,11 @@ def main():
         with col2:
             st.dataframe(selected_by_team_df, hide_index=True)
 
-    [st.plotly_chart(player_plot(players, pid), use_container_width=True)
-     for pid in st.session_state['selected_pids']]
+    [st.plotly_chart(fig, use_container_width=True)
+     for fig in cached_player_plots(index, st.session_state['selected_pids'])]
 
     st.dataframe(
-        players
-        .filter(pl.col('season') == settings['season'])
+        current
         .filter(pl.col('tid') >= 0)
         .select('team', 'value', 'cv_current', pl.col('cv_next').clip(0, ), 'cv_total')
         .group_by('team')
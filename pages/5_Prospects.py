@@ -2,6 +2,8 @@ import streamlit as st
 import polars as pl
 
 from hgm.plots.player_plots import player_plot
+from hgm.plots.queries import PREDICATES, query_players
+from hgm.plots.tables import gradient, number, select_rows
 
 # Set page configuration with Bootstrap theme
 st.set_page_config(
@@ -17,6 +19,13 @@ def safe_load_players():
         st.stop()
 
 
+def safe_load_index():
+    if 'data' in st.session_state:
+        return st.session_state['data']['index']
+    else:
+        st.stop()
+
+
 def safe_load_teams():
     if 'data' in st.session_state:
         return st.session_state['data']['teams']
@@ -54,47 +63,38 @@ def select_teams(df: pl.DataFrame):
     return selected_teams
 
 
-def filter_teams(df, selected_teams):
+def team_query(selected_teams):
     if selected_teams != ['*All*']:
-        return df.filter(pl.col('team').is_in(selected_teams))
+        return {'teams': selected_teams}
     else:
-        return df
+        return {}
+
+
+TABLE_STYLES = {
+    'pid': number(0),
+    'draft_year': number(0),
+    'age': number(0),
+    'pr_rk': number(0),
+    'pr_rk_pos': number(0),
+    'ovr': gradient(26, 80, precision=0),
+    'pot': gradient(26, 80, precision=0),
+    'sum_value': gradient(-150, 150),
+}
 
 
 def display_and_select_pids(df):
-    df = df.to_pandas()
     if 'selected_pids' not in st.session_state:
         st.session_state.selected_pids = []
 
-    df_with_selections = df.copy()
-    df_with_selections.insert(0, "Select", False)
-
-    # Get dataframe row-selections from user with st.data_editor
-    edited_df = st.data_editor(
-        (
-            df_with_selections
-            .style
-            .format(precision=0, subset=['pid', 'draft_year', 'age', 'ovr', 'pot', 'pr_rk', 'pr_rk_pos'])
-            .format(precision=2, subset=['sum_value'])
-            .background_gradient(cmap='RdBu_r', vmin=26, vmax=80, subset=['ovr', 'pot'])
-            .background_gradient(cmap='RdBu_r', vmin=-150, vmax=150, subset=['sum_value'])
-        )
-        ,
-        hide_index=True,
-        column_config={"Select": st.column_config.CheckboxColumn(required=True)},
-        disabled=df.columns,
-        use_container_width=True
-    )
-
-    # Filter the dataframe using the temporary column, then drop the column
-    selected_pids = list(set(edited_df[edited_df.Select]['pid'].to_list() + st.session_state.selected_pids))
+    selected = select_rows(df, TABLE_STYLES)
+    selected_pids = list(set(selected['pid'].to_list() + st.session_state.selected_pids))
     return selected_pids
 
 
 def main():
-    players = safe_load_players().filter(pl.col('age') <= 21)
     teams = safe_load_teams()
     settings = safe_load_settings()
+    players = safe_load_index().season(settings['season']).filter(pl.col('age') <= 21)
     my_team_id = settings['userTid'][-1]['value']
     st.markdown(
         f"Season: {settings['season']}, "
@@ -102,45 +102,30 @@ def main():
     )
 
     selected_teams = select_teams(teams)
-
-    df_filtered = filter_teams(players, selected_teams)
     selected_position = st.selectbox('Select Position', options=['All', 'C', 'W', 'D', 'G'])
-    if selected_position != 'All':
-        df_filtered = df_filtered.filter(pl.col('pos') == selected_position)
 
     if st.button('Clear selected players'):
         st.session_state['selected_pids'] = []
 
-    df_display = (
-        df_filtered
-        .filter(pl.col('season') == settings['season'])
-        .select(
-            'player', 'pid', 'draft_year', 'team', 'pos', 'age', 'pr_rk', 'pr_rk_pos', 'ovr', 'pot', pl.col('sum_value')
-        )
-        .sort('sum_value', descending=True)
-    )
-
-    filter_dict = {
-        'Upcoming FA': (pl.col('years') == 1),
-        'Dead Weight': (pl.col('years') > 1) & (pl.col('cv_total') < 0)
-    }
-
-    filters_to_apply = []
-
     filter_columns = st.columns(2)
-    for i, filter_type in enumerate(filter_dict.keys()):
-        selection = filter_columns[i].checkbox(filter_type)
-        if selection:
-            filters_to_apply.append(filter_dict[filter_type])
-
-    if filters_to_apply:
-        df_display = df_display.filter(filters_to_apply)
+    predicates = [
+        predicate for column, predicate in zip(filter_columns, PREDICATES) if column.checkbox(predicate)
+    ]
+
+    df_display = query_players(
+        safe_load_players(),
+        settings['season'],
+        ['player', 'pid', 'draft_year', 'team', 'pos', 'age', 'pr_rk', 'pr_rk_pos', 'ovr', 'pot', 'sum_value'],
+        **team_query(selected_teams),
+        positions=None if selected_position == 'All' else [selected_position],
+        predicates=predicates,
+        sort='sum_value',
+    ).filter(pl.col('age') <= 21)
 
     display_and_select_pids(df_display)
 
     st.dataframe(
         players
-        .filter(pl.col('season') == settings['season'])
         .filter(pl.col('tid') >= 0)
         .with_columns(
             top_10=pl.col('pr_rk') <= 10,
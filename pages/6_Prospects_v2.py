@@ -2,6 +2,8 @@ import streamlit as st
 import polars as pl
 
 from hgm.plots.player_plots import player_plot
+from hgm.plots.queries import query_players
+from hgm.plots.tables import gradient, number, select_rows
 
 # Set page configuration with Bootstrap theme
 st.set_page_config(
@@ -17,6 +19,13 @@ def safe_load_players():
         st.stop()
 
 
+def safe_load_index():
+    if 'data' in st.session_state:
+        return st.session_state['data']['index']
+    else:
+        st.stop()
+
+
 def safe_load_teams():
     if 'data' in st.session_state:
         return st.session_state['data']['teams']
@@ -61,40 +70,31 @@ def filter_teams(df, selected_teams):
         return df.filter(pl.col('team') != 'Draft')
 
 
+TABLE_STYLES = {
+    'pid': number(0),
+    'draft_year': number(0),
+    'age': number(0),
+    'pr_rk': number(0),
+    'pr_rk_pos': number(0),
+    'ovr': gradient(26, 80, precision=0),
+    'pot': gradient(26, 80, precision=0),
+    'sum_value': gradient(-150, 150),
+}
+
+
 def display_and_select_pids(df):
-    df = df.to_pandas()
     if 'selected_pids' not in st.session_state:
         st.session_state.selected_pids = []
 
-    df_with_selections = df.copy()
-    df_with_selections.insert(0, "Select", False)
-
-    # Get dataframe row-selections from user with st.data_editor
-    edited_df = st.data_editor(
-        (
-            df_with_selections
-            .style
-            .format(precision=0, subset=['pid', 'draft_year', 'age', 'ovr', 'pot', 'pr_rk', 'pr_rk_pos'])
-            .format(precision=2, subset=['sum_value'])
-            .background_gradient(cmap='RdBu_r', vmin=26, vmax=80, subset=['ovr', 'pot'])
-            .background_gradient(cmap='RdBu_r', vmin=-150, vmax=150, subset=['sum_value'])
-        )
-        ,
-        hide_index=True,
-        column_config={"Select": st.column_config.CheckboxColumn(required=True)},
-        disabled=df.columns,
-        use_container_width=True
-    )
-
-    # Filter the dataframe using the temporary column, then drop the column
-    selected_pids = list(set(edited_df[edited_df.Select]['pid'].to_list() + st.session_state.selected_pids))
+    selected = select_rows(df, TABLE_STYLES)
+    selected_pids = list(set(selected['pid'].to_list() + st.session_state.selected_pids))
     return selected_pids
 
 
 def main():
-    players = safe_load_players().filter(pl.col('age') <= 21)
     teams = safe_load_teams()
     settings = safe_load_settings()
+    players = safe_load_index().season(settings['season']).filter(pl.col('age') <= 21)
     my_team_id = settings['userTid'][-1]['value']
     st.markdown(
         f"Season: {settings['season']}, "
@@ -131,18 +131,19 @@ def main():
     select_position = create_conditional_multiselect(players, 'pos', 'Positions')
     select_draft_year = create_conditional_multiselect(players, 'draft_year', 'Draft Years')
 
+    display_columns = ['player', 'draft_year', 'team', 'pr_rk', 'pr_rk_pos', 'pos', 'age', 'ovr', 'pot', 'sum_value']
+
     # Apply filters
     filtered_players = (
-        players
-        .filter(pl.col('season') == settings['season'])
-        .filter(pl.col('team').is_in(select_team))
-        .filter(pl.col('pos').is_in(select_position))
+        query_players(
+            safe_load_players(), settings['season'], display_columns,
+            teams=select_team, positions=select_position, sort='sum_value',
+        )
+        .filter(pl.col('age') <= 21)
         .filter(pl.col('draft_year').is_in(select_draft_year))
-        .sort('sum_value', descending=True)
     )
 
-    display_columns = ['player', 'draft_year', 'team', 'pr_rk', 'pr_rk_pos', 'pos', 'age', 'ovr', 'pot', 'sum_value']
-    formatted_players = format_dataframe(filtered_players.select(display_columns))
+    formatted_players = format_dataframe(filtered_players)
     st.dataframe(
         formatted_players,
         column_config={
@@ -155,7 +156,6 @@ def main():
 
     st.dataframe(
         players
-        .filter(pl.col('season') == settings['season'])
         .filter(pl.col('tid') >= 0)
         .with_columns(
             top_10=pl.col('pr_rk') <= 10,